@@ -1,189 +1,490 @@
-import json
-import sqlite3
-import logging
-from packaging.specifiers import SpecifierSet
-from packaging.version import Version, InvalidVersion
-
-logging.basicConfig(level=logging.INFO, format='%(message)s')
-
-
-
-
-class DBClient:
-    def __init__(self, db_path):
-        """
-        Inicializa o cliente do banco de dados.
-        :param db_path: Caminho para o arquivo .db
-        """
-        self.db_path = db_path
-        self.table_name = "projects"
-
-
-
-    def get_connection(self):
-        """
-        Cria uma conexão com row_factory e registra a função de versão.
-        """
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        
-        # REGISTRO DA FUNÇÃO: Permite usar version_match(ver, spec) no SQL
-        conn.create_function("version_match", 2, self._sql_version_match)
-        
-        return conn
-
-
-
-    @staticmethod
-    def _sql_version_match(version, specifier):
-        """
-        Função auxiliar executada pelo SQLite.
-        Retorna 1 se a versão atende ao specifier, 0 caso contrário.
-        """
-        if not specifier or specifier == "":
-            return 1 # Sem restrição = compatível
-        if not version:
-            return 0 
-            
-        try:
-            v = Version(str(version))
-            spec = SpecifierSet(str(specifier))
-            return 1 if spec.contains(v, prereleases=True) else 0
-        except (InvalidVersion, ValueError):
-            return 0
-
-
-
-    def get_available_versions(self, package):
-        """
-        Retorna todas as versões disponíveis para um pacote.
-        """
-        if not package: return []
-
-        query = f"SELECT version FROM {self.table_name} WHERE LOWER(name) = ?"
-        
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, (package.lower(),))
-            rows = cursor.fetchall()
-            return [row['version'] for row in rows]
-
-
-
-    def get_dependencies(self, package, version):
-        """
-        Retorna a lista de dependências (requires_dist) de um pacote específico.
-        """
-        query = f"SELECT requires_dist FROM {self.table_name} WHERE LOWER(name) = ? AND version = ?"
-        
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, (package.lower(), version))
-            row = cursor.fetchone()
-            
-            if row and row['requires_dist']:
-                try:
-                    return json.loads(row['requires_dist'])
-                except json.JSONDecodeError:
-                    return [row['requires_dist']]
-            return []
-
-
-
-    def version_satisfies(self, version, specifier):
-        """
-        Verifica se uma versão atende a um especificador.
-        Mantida como utilitário para uso fora de queries.
-        """
-        try:
-            v = Version(version)
-            spec = SpecifierSet(specifier)
-            return v in spec
-        except InvalidVersion:
-            logging.warning(f"AVISO: Versão inválida encontrada: {version}")
-            return False
-
-
-
-    def package_and_version_exists(self, package, version):
-        """
-        Verifica se existe pelo menos uma versão no banco que atenda ao especificador passado.
-        
-        Args:
-            package: Nome do pacote.
-            version: Agora atua como SPECIFIER (ex: "==1.0", ">=2.0").
-        """
-        # A query verifica:
-        # 1. Se o nome do pacote bate
-        # 2. Se a versão salva no banco (coluna version) satisfaz o specifier passado 
-        query = f"""
-            SELECT 1 
-            FROM {self.table_name} 
-            WHERE LOWER(name) = ? 
-            AND version_match(version, ?) 
-            LIMIT 1
-        """
-        
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, (package.lower(), version))
-            return cursor.fetchone() is not None
-
-
-
-    def python_version_satisfies_package(self, package, version, python_version):
-        """
-        Verifica se uma versão específica do Python é compatível
-        com o 'requires_python' definido no pacote, usando lógica SQL.
-        """
-        # A query agora calcula a compatibilidade diretamente no banco.
-        # CASE WHEN verifica: Se for nulo/vazio -> 1 (True), senão usa a função customizada.
-        query = f"""
-            SELECT 
-                CASE 
-                    WHEN requires_python IS NULL THEN 1 
-                    ELSE version_match(?, requires_python) 
-                END as is_compatible
-            FROM {self.table_name} 
-            WHERE LOWER(name) = ?  AND version = ?
-        """
-        
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            # Note a ordem dos parâmetros: python_version primeiro (para o version_match), depois name e version
-            cursor.execute(query, (python_version, package.lower(), version))
-            row = cursor.fetchone()
-            
-            # Mantendo a lógica original: 
-            # Se o pacote não existe (row is None), retorna True
-            if row is None:
-                return True
-            
-            # Retorna o resultado booleano calculado pelo SQLite (0 ou 1)
-            return bool(row['is_compatible'])
-        
-
-    def is_yanked(self, package, version):
-        """
-        Verifica se uma versão específica de um pacote foi marcada como 'yanked' (descontinuada/removida).
-        
-        Args:
-            package: Nome do pacote.
-            version: Versão exata do pacote.
-            
-        Returns:
-            bool: True se o pacote estiver marcado como yanked, False caso contrário.
-        """
-        # A query seleciona a coluna 'yanked' baseada no nome e versão exata
-        query = f"SELECT yanked FROM {self.table_name} WHERE LOWER(name) = ?  AND version = ?"
-        
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, (package.lower(), version))
-            row = cursor.fetchone()
-            
-            # Se o registro existe e a coluna yanked é verdadeira (1, True, ou string não vazia)
-            if row and row['yanked']:
-                return True
-                
-            return False
\ No newline at end of file
+import os
+import re
+import sqlite3
+import logging
+from contextlib import closing
+from functools import lru_cache
+from urllib.request import pathname2url
+import orjson
+import diskcache
+from packaging.version import InvalidVersion
+from version_cache import cached_version, cached_specifier_set
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+# Caminho rápido do version_match: specifier ">=X.Y[.Z]" contra versões apenas numéricas
+_GE_SPEC_RE = re.compile(r'^\s*>=\s*(\d+(?:\.\d+)*)\s*$')
+_RELEASE_RE = re.compile(r'^\d+(?:\.\d+)*$')
+
+
+
+
+@lru_cache(maxsize=65536)
+def _release_tuple(release):
+    """
+    Converte "3.10.0" em (3, 10), removendo zeros finais para que a comparação
+    lexicográfica de tuplas siga a PEP 440 (3.10 == 3.10.0).
+    """
+    parts = [int(part) for part in release.split('.')]
+    while len(parts) > 1 and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+
+
+
+class DBClient:
+    def __init__(self, db_path, read_only=True, dep_cache_dir=None):
+        """
+        Inicializa o cliente do banco de dados.
+        :param db_path: Caminho para o arquivo .db
+        :param read_only: Se True, o arquivo é aberto somente para leitura (URI mode=ro) após a criação dos índices.
+        :param dep_cache_dir: Diretório do cache em disco de dependências. Se None, o cache não é usado.
+        """
+        self.db_path = db_path
+        self.table_name = "projects"
+        self.read_only = read_only
+
+        # Conexão persistente, criada sob demanda na primeira consulta
+        self._conn = None
+
+        # Cache persistente (pacote, versão) -> dependências, reaproveitado entre execuções
+        self._dep_cache = self._open_dep_cache(dep_cache_dir) if dep_cache_dir else None
+
+        # Cópia em memória da tabela (nome em minúsculas -> linhas), preenchida por preload()
+        self._pkg_index = None
+
+
+
+    def get_connection(self):
+        """
+        Retorna a conexão persistente do cliente, criando-a na primeira chamada.
+        Na criação, configura row_factory, registra a função de versão e aplica os PRAGMAs.
+        Em modo somente leitura, o arquivo é aberto via URI "mode=ro" depois de uma preparação única
+        (modo WAL e índices) feita em uma conexão de escrita temporária.
+        """
+        if self._conn is not None:
+            return self._conn
+
+        if self.read_only:
+            self._prepare_database()
+
+            # Conexão somente leitura no nível do arquivo; isolation_level=None evita transações implícitas.
+            # cache=shared não é usado: há uma única conexão por processo e o cache não é compartilhado entre processos.
+            uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+
+        else:
+            # check_same_thread=False: a mesma conexão é reutilizada pelas threads do servidor
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._ensure_indexes(conn)
+
+        conn.row_factory = sqlite3.Row
+        
+        # REGISTRO DA FUNÇÃO: Permite usar version_match(ver, spec) no SQL
+        # deterministic=True permite ao SQLite reaproveitar o resultado para argumentos constantes.
+        # Não é criado índice sobre version_match: o arquivo ficaria ilegível para conexões sem a função.
+        try:
+            conn.create_function("version_match", 2, self._sql_version_match, deterministic=True)
+        except sqlite3.NotSupportedError:
+            # SQLite < 3.8.3 não suporta funções determinísticas
+            conn.create_function("version_match", 2, self._sql_version_match)
+
+        # PRAGMAs por conexão, mantendo o cache de páginas aquecido entre consultas
+        conn.execute("PRAGMA cache_size=-262144")   # 256 MiB
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA mmap_size=30000000000")  # Arquivo inteiro (limitado pelo tamanho do arquivo e pelo máximo do SQLite)
+
+        self._conn = conn
+        return conn
+
+
+
+    def _prepare_database(self):
+        """
+        Ativa o modo WAL (leitores não bloqueiam uns aos outros) e cria os índices ausentes
+        usando uma conexão de escrita de curta duração. Ambas as alterações ficam gravadas no arquivo.
+        """
+        try:
+            # timeout alto: vários workers podem iniciar ao mesmo tempo e aguardar a criação do índice
+            with closing(sqlite3.connect(self.db_path, timeout=600)) as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                self._ensure_indexes(conn)
+
+        except sqlite3.OperationalError as e:
+            # Arquivo ou diretório sem permissão de escrita: segue com o modo de journal atual
+            logging.warning(f'AVISO: Não foi possível preparar o banco "{self.db_path}": {e}')
+
+
+
+    def _ensure_indexes(self, conn):
+        """
+        Cria, se ainda não existir, o índice de expressão usado pelas consultas por LOWER(name).
+        O índice composto (LOWER(name), version) também atende buscas apenas pelo nome.
+        """
+        index_name = f"idx_{self.table_name}_lname_ver"
+
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)
+        ).fetchone()
+        if row is not None:
+            return
+
+        try:
+            logging.info(f'Criando índice "{index_name}" na tabela "{self.table_name}"...')
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {self.table_name}(LOWER(name), version)")
+            conn.execute(f"ANALYZE {self.table_name}")
+            conn.commit()
+
+        except sqlite3.OperationalError as e:
+            # Banco somente leitura ou tabela ausente: segue sem índice
+            logging.warning(f'AVISO: Não foi possível criar o índice "{index_name}": {e}')
+
+
+
+    def _open_dep_cache(self, cache_dir):
+        """
+        Abre o cache em disco de dependências.
+        O conteúdo é descartado quando o arquivo do banco foi modificado desde o preenchimento do cache.
+        """
+        cache = diskcache.Cache(cache_dir)
+
+        try:
+            db_mtime = os.path.getmtime(self.db_path)
+        except OSError:
+            db_mtime = None
+
+        if cache.get("__db_mtime__") != db_mtime:
+            logging.info(f'Cache de dependências em "{cache_dir}" desatualizado. Limpando...')
+            cache.clear()
+            cache.set("__db_mtime__", db_mtime)
+
+        return cache
+
+
+
+    def preload(self, max_bytes):
+        """
+        Carrega a tabela de pacotes em memória, indexada pelo nome em minúsculas, para que as consultas
+        do resolvedor sejam atendidas sem acessar o SQLite. Só é feito se o arquivo couber no limite.
+
+        Args:
+            max_bytes: Tamanho máximo do banco (page_count * page_size) para o carregamento.
+
+        Returns:
+            bool: True se a tabela foi carregada.
+        """
+        conn = self.get_connection()
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        db_bytes = page_count * page_size
+
+        if db_bytes > max_bytes:
+            logging.info('Banco com %d bytes excede o limite de pré-carga (%d bytes). Consultas seguem no SQLite.', db_bytes, max_bytes)
+            return False
+
+        index = {}
+        query = f"SELECT LOWER(name), version, yanked, requires_python, requires_dist FROM {self.table_name}"
+        for name, version, yanked, requires_python, requires_dist in conn.execute(query):
+            index.setdefault(name, []).append((version, bool(yanked), requires_python, requires_dist))
+
+        self._pkg_index = index
+        logging.info('Pré-carga concluída: %d pacote(s) em memória.', len(index))
+        return True
+
+
+
+    def close(self):
+        """
+        Fecha a conexão persistente e o cache de dependências, se existirem.
+        """
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+        if self._dep_cache is not None:
+            self._dep_cache.close()
+
+
+
+    @staticmethod
+    @lru_cache(maxsize=131072)
+    def _sql_version_match(version, specifier):
+        """
+        Função auxiliar executada pelo SQLite.
+        Retorna 1 se a versão atende ao specifier, 0 caso contrário.
+        O resultado é memorizado por (versão, specifier): os mesmos pares se repetem entre linhas e consultas
+        (ex: a versão do Python alvo contra os poucos valores distintos de 'requires_python').
+        """
+        if not specifier or specifier == "":
+            return 1 # Sem restrição = compatível
+        if not version:
+            return 0 
+
+        # Caminho rápido: ">=X.Y" (forma mais comum de 'requires_python') contra versão sem sufixos
+        if isinstance(specifier, str) and isinstance(version, str) and _RELEASE_RE.match(version):
+            ge_match = _GE_SPEC_RE.match(specifier)
+            if ge_match:
+                return 1 if _release_tuple(version) >= _release_tuple(ge_match.group(1)) else 0
+            
+        # SQLite já entrega TEXT como str; a conversão só é feita para colunas de outro tipo
+        if not isinstance(version, str):
+            version = str(version)
+        if not isinstance(specifier, str):
+            specifier = str(specifier)
+
+        try:
+            v = cached_version(version)
+            spec = cached_specifier_set(specifier)
+            return 1 if spec.contains(v, prereleases=True) else 0
+        except (InvalidVersion, ValueError):
+            return 0
+
+
+
+    def get_available_versions(self, package, specifier=""):
+        """
+        Retorna as versões disponíveis para um pacote.
+        Se um specifier for passado (ex: ">=1.0"), o filtro é aplicado pelo próprio SQLite.
+        """
+        if not package: return []
+
+        query = f"SELECT version FROM {self.table_name} WHERE LOWER(name) = ? AND version_match(version, ?)"
+        
+        conn = self.get_connection()
+        # Itera o cursor diretamente, acessando a coluna por índice (sem busca por nome)
+        cursor = conn.execute(query, (package.lower(), specifier))
+        return [row[0] for row in cursor]
+
+
+
+    def iter_versions_with_metadata(self, package, python_version=None, specifier=""):
+        """
+        Gera, a partir de uma única consulta, as versões de um pacote que atendem ao specifier,
+        junto com os metadados usados na filtragem. As linhas são lidas do cursor sob demanda.
+
+        Args:
+            package: Nome do pacote.
+            python_version: Versão do Python alvo. Se None, toda versão é considerada compatível.
+            specifier: Restrição de versão (ex: ">=1.0,<2.0"). Vazio = todas as versões.
+
+        Yields:
+            tuple: (version, is_yanked, python_ok).
+        """
+        if not package: return
+
+        # Tabela pré-carregada: mesma filtragem da consulta abaixo, feita sobre a cópia em memória.
+        # Como a cópia é completa, um nome ausente significa pacote inexistente.
+        if self._pkg_index is not None:
+            for version, yanked, requires_python, _ in self._pkg_index.get(package.lower(), ()):
+                if not self._sql_version_match(version, specifier):
+                    continue
+                python_ok = python_version is None or not requires_python or self._sql_version_match(python_version, requires_python)
+                yield version, yanked, bool(python_ok)
+            return
+
+        # A compatibilidade com o Python é calculada pelo SQLite na mesma varredura.
+        # Sem versão alvo ou sem 'requires_python' definido -> 1 (compatível).
+        query = f"""
+            SELECT 
+                version,
+                yanked,
+                CASE 
+                    WHEN ? IS NULL OR requires_python IS NULL OR requires_python = '' THEN 1 
+                    ELSE version_match(?, requires_python) 
+                END as python_ok
+            FROM {self.table_name} 
+            WHERE LOWER(name) = ? 
+            AND version_match(version, ?)
+        """
+
+        conn = self.get_connection()
+        cursor = conn.execute(query, (python_version, python_version, package.lower(), specifier))
+        for version, yanked, python_ok in cursor:
+            yield version, bool(yanked), bool(python_ok)
+
+
+
+    def get_dependencies(self, package, version):
+        """
+        Retorna a lista de dependências (requires_dist) de um pacote específico.
+        Com a tabela pré-carregada, lê da memória; caso contrário, consulta primeiro o cache em disco, quando configurado.
+        """
+        cache_key = (package.lower(), version)
+
+        # A cópia em memória já é mais rápida que o cache em disco, que só é usado sem pré-carga
+        use_disk_cache = self._dep_cache is not None and self._pkg_index is None
+        if use_disk_cache:
+            dependencies = self._dep_cache.get(cache_key)
+            if dependencies is not None:
+                return dependencies
+
+        if self._pkg_index is not None:
+            requires_dist = next(
+                (dist for ver, _, _, dist in self._pkg_index.get(cache_key[0], ()) if ver == version), None
+            )
+
+        else:
+            query = f"SELECT requires_dist FROM {self.table_name} WHERE LOWER(name) = ? AND version = ?"
+            
+            conn = self.get_connection()
+            row = conn.execute(query, cache_key).fetchone()
+            requires_dist = row[0] if row else None
+        
+        dependencies = []
+        if requires_dist:
+            try:
+                dependencies = orjson.loads(requires_dist)
+            except orjson.JSONDecodeError:
+                dependencies = [requires_dist]
+
+        if use_disk_cache:
+            self._dep_cache.set(cache_key, dependencies)
+
+        return dependencies
+
+
+
+    def version_satisfies(self, version, specifier):
+        """
+        Verifica se uma versão atende a um especificador.
+        Mantida como utilitário para uso fora de queries.
+        """
+        try:
+            v = cached_version(version)
+            spec = cached_specifier_set(specifier)
+            return v in spec
+        except InvalidVersion:
+            logging.warning(f"AVISO: Versão inválida encontrada: {version}")
+            return False
+
+
+
+    def package_and_version_exists(self, package, version):
+        """
+        Verifica se existe pelo menos uma versão no banco que atenda ao especificador passado.
+        
+        Args:
+            package: Nome do pacote.
+            version: Agora atua como SPECIFIER (ex: "==1.0", ">=2.0").
+        """
+        # A query verifica:
+        # 1. Se o nome do pacote bate
+        # 2. Se a versão salva no banco (coluna version) satisfaz o specifier passado 
+        query = f"""
+            SELECT 1 
+            FROM {self.table_name} 
+            WHERE LOWER(name) = ? 
+            AND version_match(version, ?) 
+            LIMIT 1
+        """
+        
+        conn = self.get_connection()
+        cursor = conn.execute(query, (package.lower(), version))
+        return cursor.fetchone() is not None
+
+
+
+    def find_existing_packages(self, requirements):
+        """
+        Verifica, em uma única consulta, quais pacotes possuem ao menos uma versão que atenda ao especificador.
+
+        Args:
+            requirements (dict): { 'pacote': specifier }. Specifier None ou "" aceita qualquer versão.
+
+        Returns:
+            set: Nomes (em minúsculas) dos pacotes encontrados.
+        """
+        if not requirements: return set()
+
+        unconstrained = [package.lower() for package, specifier in requirements.items() if not specifier]
+        constrained = [(package.lower(), specifier) for package, specifier in requirements.items() if specifier]
+
+        cte = ""
+        subqueries = []
+        params = []
+
+        # Pacotes com restrição: cada par (nome, specifier) vira uma linha da tabela 'req', unida à tabela de pacotes
+        if constrained:
+            values = ", ".join(["(?, ?)"] * len(constrained))
+            cte = f"WITH req(name, spec) AS (VALUES {values}) "
+            subqueries.append(f"""
+                SELECT req.name FROM req
+                JOIN {self.table_name} p 
+                    ON LOWER(p.name) = req.name 
+                    AND version_match(p.version, req.spec)
+            """)
+            for package, specifier in constrained:
+                params.extend((package, specifier))
+
+        # Pacotes sem restrição: basta a existência do nome (busca pelo índice, sem version_match)
+        if unconstrained:
+            placeholders = ", ".join(["?"] * len(unconstrained))
+            subqueries.append(f"SELECT LOWER(name) FROM {self.table_name} WHERE LOWER(name) IN ({placeholders})")
+            params.extend(unconstrained)
+
+        # UNION elimina as repetições de nome
+        query = cte + " UNION ".join(subqueries)
+
+        conn = self.get_connection()
+        cursor = conn.execute(query, params)
+        return {row[0] for row in cursor}
+
+
+
+    def python_version_satisfies_package(self, package, version, python_version):
+        """
+        Verifica se uma versão específica do Python é compatível
+        com o 'requires_python' definido no pacote, usando lógica SQL.
+        """
+        # A query agora calcula a compatibilidade diretamente no banco.
+        # CASE WHEN verifica: Se for nulo/vazio -> 1 (True), senão usa a função customizada.
+        query = f"""
+            SELECT 
+                CASE 
+                    WHEN requires_python IS NULL THEN 1 
+                    ELSE version_match(?, requires_python) 
+                END as is_compatible
+            FROM {self.table_name} 
+            WHERE LOWER(name) = ?  AND version = ?
+        """
+        
+        conn = self.get_connection()
+        # Note a ordem dos parâmetros: python_version primeiro (para o version_match), depois name e version
+        cursor = conn.execute(query, (python_version, package.lower(), version))
+        row = cursor.fetchone()
+        
+        # Mantendo a lógica original: 
+        # Se o pacote não existe (row is None), retorna True
+        if row is None:
+            return True
+        
+        # Retorna o resultado booleano calculado pelo SQLite (0 ou 1)
+        return bool(row['is_compatible'])
+        
+
+    def is_yanked(self, package, version):
+        """
+        Verifica se uma versão específica de um pacote foi marcada como 'yanked' (descontinuada/removida).
+        
+        Args:
+            package: Nome do pacote.
+            version: Versão exata do pacote.
+            
+        Returns:
+            bool: True se o pacote estiver marcado como yanked, False caso contrário.
+        """
+        # A query seleciona a coluna 'yanked' baseada no nome e versão exata
+        query = f"SELECT yanked FROM {self.table_name} WHERE LOWER(name) = ?  AND version = ?"
+        
+        conn = self.get_connection()
+        cursor = conn.execute(query, (package.lower(), version))
+        row = cursor.fetchone()
+        
+        # Se o registro existe e a coluna yanked é verdadeira (1, True, ou string não vazia)
+        if row and row['yanked']:
+            return True
+            
+        return False
\ No newline at end of file
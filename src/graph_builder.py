@@ -1,11 +1,41 @@
+import heapq
 import logging
+import threading
+from cachetools import LRUCache
 from functools import lru_cache
-from packaging.specifiers import SpecifierSet
+from packaging.markers import Marker
 from packaging.requirements import Requirement
 from packaging.version import Version, InvalidVersion
+from version_cache import cached_version, EMPTY_SPEC
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
+# Limites dos caches de cada GraphBuilder, que vive por todo o processo (um por versão do Python e max_versions)
+CANDIDATE_CACHE_SIZE = 4096
+DEPENDENCY_CACHE_SIZE = 16384
+
+
+
+
+@lru_cache(maxsize=4096)
+def _parse_requirement(raw_dep):
+    """
+    Faz o parse de uma string de dependência (PEP 508), reutilizando parses anteriores.
+    Retorna (nome em minúsculas, SpecifierSet, Marker ou None).
+    """
+    req = Requirement(raw_dep)
+    return req.name.lower(), req.specifier, req.marker
+
+
+
+@lru_cache(maxsize=4096)
+def _marker_matches(marker_str, python_version):
+    """
+    Avalia um marcador de ambiente para a versão do Python informada, reutilizando avaliações anteriores.
+    """
+    env_markers = {"python_version": python_version, "python_full_version": python_version}
+    return Marker(marker_str).evaluate(env_markers)
+
 
 
 
@@ -29,96 +59,125 @@ class GraphBuilder:
         # Cria um objeto Version para comparações com marcadores de ambiente
         self.python_version_obj = Version(python_version) if python_version else None
 
+        # Ambiente usado na avaliação de marcadores (ex: "python_version < '3.8'")
+        self._env_markers = {}
+        if python_version:
+            self._env_markers["python_version"] = python_version
+            self._env_markers["python_full_version"] = python_version
+
+        # Memoização por instância: (pacote, restrição) -> candidatos e (pacote, versão) -> dependências.
+        # Limitada (LRU): a instância é compartilhada entre requisições e não pode crescer sem limite.
+        # LRUCache altera sua ordem interna até na leitura, por isso o acesso é protegido por lock entre threads.
+        self._cand_cache = LRUCache(maxsize=CANDIDATE_CACHE_SIZE)
+        self._dep_cache = LRUCache(maxsize=DEPENDENCY_CACHE_SIZE)
+        self._cache_lock = threading.Lock()
+
 
 
-    @lru_cache(maxsize=None)
     def get_candidate_versions(self, package_name, specifier_set=None):
         """
         Busca versões disponíveis, aplica filtros (Python, Specifier) e ordenação heurística.
+        O resultado é memorizado por (pacote, restrição).
         """
 
-        # Busca versões
-        raw_versions = self.db.get_available_versions(package_name)
-        logging.info(f'Versões iniciais encontradas para o pacote "{package_name}": {raw_versions}.')
-        candidates = []
-
         if specifier_set is None:
-            specifier_set = SpecifierSet("")
+            specifier_set = EMPTY_SPEC
 
-        for version in raw_versions:
+        cache_key = (package_name.lower(), str(specifier_set))
+        with self._cache_lock:
+            candidates = self._cand_cache.get(cache_key)
+        if candidates is not None:
+            return candidates
 
-            try:
-                version_obj = Version(version)
+        # Versões que atendem ao specifier (filtro feito no SQLite), lidas do cursor sob demanda
+        rows = self.db.iter_versions_with_metadata(package_name, self.python_version or None, str(specifier_set))
+        candidates = self._iter_candidates(package_name, specifier_set, rows)
 
-            except InvalidVersion:
-                logging.info(f'Versão inválida ignorada no banco: "{version}" do pacote "{package_name}".')
-                continue
+        # Ordenação: não-yanked primeiro e, dentro de cada grupo, da versão mais nova para a mais antiga
+        sort_key = lambda x: (not x['is_yanked'], x['version_obj'])
+
+        if self.max_versions:
+            # Poda pela quantidade máxima de versões: seleção top-k sem materializar nem ordenar a lista completa
+            candidates = heapq.nlargest(self.max_versions, candidates, key=sort_key)
+        else:
+            candidates = sorted(candidates, key=sort_key, reverse=True)
+
+        with self._cache_lock:
+            self._cand_cache[cache_key] = candidates
+        return candidates
 
-            # Filtro: Specifier
-            if not specifier_set.contains(version_obj, prereleases=True):
-                logging.info(f'Versão rejeitada: {version_obj} | Spec: {specifier_set}.')
+
+
+    def _iter_candidates(self, package_name, specifier_set, rows):
+        """
+        Converte as linhas do banco em candidatos, descartando versões incompatíveis com o Python e inválidas.
+        """
+
+        found = 0
+        python_rejected = 0
+
+        # Nome normalizado uma única vez, e não a cada linha do banco
+        package_key = package_name.lower()
+
+        for version, is_yanked, python_ok in rows:
+            found += 1
+
+            # Filtro: Compatibilidade com Python (antes do parse, evitando criar Version para versões rejeitadas)
+            if not python_ok:
+                python_rejected += 1
                 continue
 
-            # Filtro: Compatibilidade com Python
-            if self.python_version:
-                if not self.db.python_version_satisfies_package(package_name, version, self.python_version):
-                    logging.info(f'Versão Python do pacote "{package_name}" na versão "{version}" não é compatível com Python {self.python_version}.')
-                    continue
+            try:
+                version_obj = cached_version(version)
 
-            # Metadados
-            is_yanked = self.db.is_yanked(package_name, version)
+            except InvalidVersion:
+                logging.info('Versão inválida ignorada no banco: "%s" do pacote "%s".', version, package_name)
+                continue
 
-            candidate = {
-                'package': package_name.lower(),
+            yield {
+                'package': package_key,
                 'version_obj': version_obj,
                 'version': version,
-                'is_yanked': bool(is_yanked),
+                'is_yanked': is_yanked,
             }
-            candidates.append(candidate)
-
-        # Ordenação
-        candidates.sort(key=lambda x: x['version_obj'], reverse=True)
-        candidates.sort(key=lambda x: x['is_yanked'])
 
-        # Poda pela quantidade máxima de versões definida
-        if self.max_versions and len(candidates) > self.max_versions:
-            candidates = candidates[:self.max_versions]
-
-        return candidates
+        logging.info('%d versão(ões) encontrada(s) para o pacote "%s" com a restrição "%s".', found, package_name, specifier_set)
+        if python_rejected:
+            logging.info('%d versão(ões) do pacote "%s" não são compatíveis com Python %s.', python_rejected, package_name, self.python_version)
 
 
 
-    @lru_cache(maxsize=None)
     def get_dependencies(self, package_name, version):
         """
         Retorna as dependências de um pacote.
         Filtra apenas por versão do Python se ela estiver definida.
+        O resultado é memorizado por (pacote, versão).
         """
 
+        cache_key = (package_name.lower(), version)
+        with self._cache_lock:
+            cleaned_deps = self._dep_cache.get(cache_key)
+        if cleaned_deps is not None:
+            return cleaned_deps
+
         raw_deps_list = self.db.get_dependencies(package_name, version)
-        logging.info(f'Obtidas dependências brutas para "{package_name}" na versão "{version}": {raw_deps_list}')
+        logging.info('Obtidas dependências brutas para "%s" na versão "%s": %s', package_name, version, raw_deps_list)
         cleaned_deps = []
 
-        # Configura marcador para versão do Python
-        env_markers = {}
-        if self.python_version:
-            env_markers["python_version"] = self.python_version
-            env_markers["python_full_version"] = self.python_version 
-
         for raw_dep in raw_deps_list:
 
             try:
-                req = Requirement(raw_dep)
+                dep_name, dep_specifier, dep_marker = _parse_requirement(raw_dep)
                 
                 # Se houver marcadores (ex: "python_version < '3.8'")
-                if req.marker:
+                if dep_marker:
 
                     # CASO 1: A versão do Python está definida 
                     if self.python_version:
 
                         # O marcador com a versão do Python fornecida é avaliado
-                        if not req.marker.evaluate(env_markers):
-                            logging.info(f'Dependência rejeitada: "{raw_dep}". Motivo: Marcador "{req.marker}" falhou para o ambiente "{env_markers}".')
+                        if not _marker_matches(str(dep_marker), self.python_version):
+                            logging.info('Dependência rejeitada: "%s". Motivo: Marcador "%s" falhou para o ambiente "%s".', raw_dep, dep_marker, self._env_markers)
                             continue # Marcador falhou (ex: versão python incompatível), descarta
                     
                     # CASO 2: Python indefinido - ERRO
@@ -126,11 +185,13 @@ class GraphBuilder:
                         logging.info(f'ERRO: Versão do Python não definida. Não é possível avaliar dependência "{raw_dep}".')
                         raise ValueError(f'Versão do Python não definida. Não é possível avaliar dependência "{raw_dep}".')
 
-                cleaned_deps.append((req.name.lower(), req.specifier))
+                cleaned_deps.append((dep_name, dep_specifier))
 
             except Exception as e:
                 # Se falhar o parse, ignora a dependência por segurança
                 logging.error(f'ERRO DE PARSE: Não foi possível processar a dependência "{raw_dep}" do pacote "{package_name}". Erro: "{e}".')
                 continue
 
+        with self._cache_lock:
+            self._dep_cache[cache_key] = cleaned_deps
         return cleaned_deps
\ No newline at end of file
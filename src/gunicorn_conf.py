@@ -0,0 +1,21 @@
+import os
+import multiprocessing
+
+
+# --- CONFIGURAÇÃO DO GUNICORN (produção) ---
+# Uso: gunicorn -c gunicorn_conf.py main:app
+# Cada worker é um processo com seu próprio event loop (Uvicorn): o Resolver, limitado pela CPU,
+# passa a escalar com o número de núcleos em vez de disputar um único processo.
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+
+worker_class = "uvicorn.workers.UvicornWorker"
+
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# O módulo da aplicação é importado uma vez antes do fork (páginas compartilhadas via copy-on-write).
+# A conexão com o SQLite NÃO é aberta na importação: o lifespan de cada worker cria a sua após o fork.
+preload_app = True
+
+# Resoluções longas não devem derrubar o worker pelo timeout padrão (30s)
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 300))
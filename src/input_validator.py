@@ -1,9 +1,14 @@
 import re
 import logging
-from packaging.specifiers import SpecifierSet, InvalidSpecifier
+from packaging.specifiers import InvalidSpecifier
+from version_cache import cached_specifier_set
 
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
+# Padrões compilados uma única vez no carregamento do módulo
+_PKG_NAME_RE = re.compile(r'^[A-Za-z0-9_\-\.]+$')
+_PY_VER_RE = re.compile(r'^\d+\.\d+(\.\d+)?$')
+
 
 
 
@@ -46,19 +51,6 @@ class InputValidator:
             return False, f'Chaves desconhecidas encontradas no input: {unknown_keys}.'
 
 
-        # Verificação de segurança e normalização de nomes
-        if 'fixed' in input_data and 'wants' in input_data:
-            # Normaliza as chaves 
-            fixed_keys = {k.lower() for k in input_data['fixed'].keys()}
-            wants_set = {k.lower() for k in input_data['wants']}
-
-            intersection = fixed_keys.intersection(wants_set)
-
-            if intersection:
-                logging.info(f'Pacotes não podem estar em "fixed" e "wants" simultaneamente: {intersection}.')
-                return False, f'Pacotes não podem estar em "fixed" e "wants" simultaneamente: {intersection}.'
-
-
         # Validação da Versão do Python
         if 'python' in input_data:
 
@@ -72,12 +64,14 @@ class InputValidator:
                     return False, 'O campo "python" deve ser uma string, por exemplo: "3.10".'
                 
                 # Validação simples de formato X.Y ou X.Y.Z
-                if not re.match(r'^\d+\.\d+(\.\d+)?$', python_version):
+                if not _PY_VER_RE.match(python_version):
                     logging.info(f'Formato de versão Python inválido: "{python_version}".')
                     return False, f'Formato de versão Python inválido: "{python_version}". Use X.Y ou X.Y.Z.'
 
 
         # Validação de Pacotes Fixos ('fixed')
+        fixed_entries = []
+        fixed_deps_normalized = {}
         if 'fixed' in input_data:
 
             logging.info('Validando pacotes fixos em "fixed".')
@@ -88,7 +82,6 @@ class InputValidator:
                 logging.info('O campo "fixed" não foi preenchido corretamente.')
                 return False, 'O campo "fixed" deve ser um dicionário {"pacote": "versão"}.'
 
-            fixed_deps_normalized = {}
             for package, version_spec in raw_fixed_deps.items():
 
                 norm_name = package.lower()
@@ -103,19 +96,13 @@ class InputValidator:
                     logging.info(f'Especificador de versão inválido para "{package}": "{version_spec}".')
                     return False, f'Especificador de versão inválido para "{package}": "{version_spec}".'
 
-                logging.info(f'Verificando existência do pacote "{package}" com a versão/restrição "{version_spec}" no banco de dados.')
-
-                # Valida existência no DB passando o nome e a versão/restrição
-                if not self.db_client.package_and_version_exists(norm_name, version_spec):
-                    logging.info(f'O pacote "{package}" com a versão/restrição "{version_spec}" não foi encontrado ou não é válido no banco de dados.')
-                    return False, f'O pacote "{package}" com a versão/restrição "{version_spec}" não foi encontrado ou não é válido no banco de dados.'
-
+                fixed_entries.append((package, norm_name, version_spec))
                 fixed_deps_normalized[norm_name] = version_spec
-
-            input_data['fixed'] = fixed_deps_normalized
                 
 
         # Validação de Pacotes Desejados ('wants')
+        wants_entries = []
+        wants_set = set()
         if 'wants' in input_data:
 
             logging.info('Validando pacotes desejados em "wants".')
@@ -126,7 +113,6 @@ class InputValidator:
                 logging.info('O campo "wants" não foi preenchido corretamente.')
                 return False, 'O campo "wants" deve ser uma lista de strings.'
             
-            wants_normalized = []
             for item in raw_wants_deps:
 
                 if not isinstance(item, str):
@@ -139,7 +125,45 @@ class InputValidator:
                     logging.info(f'Nome de pacote inválido em "wants": "{item}".')
                     return False, f'Nome de pacote inválido em "wants": "{item}".'
 
-                if not self.db_client.package_and_version_exists(norm_name, None):
+                # Nomes repetidos (ex: "Django" e "django") são considerados uma única vez
+                if norm_name in wants_set:
+                    continue
+
+                wants_set.add(norm_name)
+                wants_entries.append((item, norm_name))
+
+
+        # Verificação de segurança: a view de chaves do dicionário já suporta operações de conjunto
+        intersection = fixed_deps_normalized.keys() & wants_set
+        if intersection:
+            logging.info(f'Pacotes não podem estar em "fixed" e "wants" simultaneamente: {intersection}.')
+            return False, f'Pacotes não podem estar em "fixed" e "wants" simultaneamente: {intersection}.'
+
+
+        # Verificação de existência no banco: uma única consulta para todos os pacotes
+        requirements = dict(fixed_deps_normalized)
+        for _, norm_name in wants_entries:
+            requirements.setdefault(norm_name, None)
+
+        logging.info(f'Verificando existência de {len(requirements)} pacote(s) no banco de dados.')
+        existing = self.db_client.find_existing_packages(requirements)
+
+        if 'fixed' in input_data:
+
+            for package, norm_name, version_spec in fixed_entries:
+
+                if norm_name not in existing:
+                    logging.info(f'O pacote "{package}" com a versão/restrição "{version_spec}" não foi encontrado ou não é válido no banco de dados.')
+                    return False, f'O pacote "{package}" com a versão/restrição "{version_spec}" não foi encontrado ou não é válido no banco de dados.'
+
+            input_data['fixed'] = fixed_deps_normalized
+
+        if 'wants' in input_data:
+
+            wants_normalized = []
+            for item, norm_name in wants_entries:
+
+                if norm_name not in existing:
                     logging.info(f'O pacote "{item}" listado em "wants" não foi encontrado no banco de dados.')
                     return False, f'O pacote "{item}" listado em "wants" não foi encontrado no banco de dados.'
 
@@ -155,7 +179,7 @@ class InputValidator:
         """
         Verifica se o nome do pacote segue regras básicas (alfanumérico, -, _, .).
         """
-        return re.match(r'^[A-Za-z0-9_\-\.]+$', name) is not None
+        return _PKG_NAME_RE.match(name) is not None
 
 
 
@@ -166,9 +190,12 @@ class InputValidator:
         """
         if spec_str == '*' or spec_str == '':
             return True
+
+        if not isinstance(spec_str, str):
+            return False
         
         try:
-            SpecifierSet(spec_str)
+            cached_specifier_set(spec_str)
             return True
         
         except InvalidSpecifier:
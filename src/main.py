@@ -1,46 +1,141 @@
 import json
 import os
+import re
 import time
+import queue
+import hashlib
 import logging
+import anyio
 import uvicorn
-from typing import Dict, List, Optional
+from cachetools import LRUCache
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
+import orjson
+from typing import Annotated, Any, Dict, List, Optional
 from fastapi import FastAPI, HTTPException, Depends, Form
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from packaging.specifiers import SpecifierSet
 
+from version_cache import cached_specifier_set, EMPTY_SPEC
 from db_client import DBClient
 from input_validator import InputValidator
 from graph_builder import GraphBuilder
-from resolver import Resolver
+from resolver import Resolver, NogoodStore
+from parallel_resolver import create_executor, resolve_parallel
+
+# Interface pública do módulo (aplicação ASGI, ciclo de vida e endpoints)
+__all__ = [
+    "app",
+    "ResolveRequest",
+    "startup_event",
+    "shutdown_event",
+    "get_db",
+    "prepare_requirements",
+    "resolve_dependencies",
+    "resolve_dependencies_stream",
+]
 
 
 # --- CONFIGURAÇÕES ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "..", "dados", "pypi-data.sqlite")
+DEP_CACHE_DIR = os.path.join(BASE_DIR, "..", "dados", ".dep_cache")
+
+# Limite de threads do anyio para o trabalho bloqueante (validação/resolução). Padrão do anyio: 40
+THREAD_LIMIT = 100
+
+# Quantidade máxima de resultados de /resolve mantidos em memória
+RESULT_CACHE_SIZE = 512
+
+# Quantidade de GraphBuilders mantidos, um por combinação (versão do Python, max_versions)
+GRAPH_BUILDER_CACHE_SIZE = 32
+
+# Tamanho máximo do banco para pré-carga em memória na inicialização (0 desativa)
+PRELOAD_MAX_BYTES = int(os.environ.get("PRELOAD_MAX_BYTES", 512 * 1024 * 1024))
+
+# Processos da busca paralela, divididos pelos candidatos do primeiro pacote (0 ou 1 desativa).
+# As requisições já são atendidas em paralelo pelos workers e threads; útil para resoluções longas e isoladas.
+RESOLVER_PROCESSES = int(os.environ.get("RESOLVER_PROCESSES", 0))
 
 # Singleton do Banco de Dados 
 _db_client: Optional[DBClient] = None
 
+# Validador compartilhado entre as requisições (não guarda estado além do DBClient)
+_validator: Optional[InputValidator] = None
+
+# Pool de processos da busca paralela (None = busca sequencial na própria thread)
+_executor = None
+
+# Listener que escreve os logs em uma thread separada (ativo durante o ciclo de vida da aplicação)
+_log_listener: Optional[QueueListener] = None
+
+# Cache de resultados de /resolve, chaveado pela entrada normalizada.
+# Só é acessado no event loop (cada leitura ou escrita é atômica ali), portanto dispensa lock. Entre a leitura
+# e a escrita há awaits (validação e resolução em thread): requisições iguais e simultâneas podem calcular
+# o mesmo resultado em duplicidade e gravá-lo duas vezes. Isso é aceito, pois o resultado é o mesmo.
+_result_cache: LRUCache = LRUCache(maxsize=RESULT_CACHE_SIZE)
+_result_cache_db_mtime: Optional[float] = None
+
+# Separadores de 'wants': vírgulas e espaços, em qualquer quantidade
+_WANTS_SPLIT = re.compile(r'[,\s]+')
+
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
 
 
 
-# Inicialização da Aplicação
-app = FastAPI(
-    title="Python Dependency Resolver",
-    description="API para resolução de dependências de pacotes Python usando Backtracking e Heurísticas.",
-    version="1.0.0"
-)
+def start_log_listener():
+    """
+    Substitui os handlers do logger raiz por um QueueHandler.
+    Os handlers originais passam a ser executados por um QueueListener em thread própria,
+    de modo que logging.info() apenas enfileira o registro em vez de escrever no stderr.
+    """
+    global _log_listener
+
+    root_logger = logging.getLogger()
+    handlers = list(root_logger.handlers)
+
+    log_queue = queue.SimpleQueue()
+    for handler in handlers:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(QueueHandler(log_queue))
+
+    _log_listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+
+
+
+
+def stop_log_listener():
+    """
+    Esvazia a fila de logs e devolve os handlers originais ao logger raiz.
+    """
+    global _log_listener
+
+    if _log_listener is None:
+        return
+
+    _log_listener.stop()
+
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        if isinstance(handler, QueueHandler):
+            root_logger.removeHandler(handler)
+    for handler in _log_listener.handlers:
+        root_logger.addHandler(handler)
+
+    _log_listener = None
 
 
 
 
-@app.on_event("startup")
 def startup_event():
     """
     Inicializa a instância do DBClient e verifica se o arquivo existe.
     """
-    global _db_client
+    global _db_client, _validator, _executor
 
     if not os.path.exists(DB_PATH):
         logging.info(f'AVISO CRÍTICO: Banco de dados "{DB_PATH}" não encontrado.')
@@ -49,13 +144,28 @@ def startup_event():
     else:
         logging.info(f'Banco de dados encontrado em: {DB_PATH}')
     
-    _db_client = DBClient(DB_PATH)
+    _db_client = DBClient(DB_PATH, dep_cache_dir=DEP_CACHE_DIR)
+
+    # Abre a conexão já na inicialização (modo WAL, índices e PRAGMAs), fora do caminho da primeira requisição
+    _db_client.get_connection()
+
+    # Bancos pequenos são mantidos inteiros em memória; os demais seguem consultados no SQLite
+    _db_client.preload(PRELOAD_MAX_BYTES)
     logging.info('Serviço de banco de dados configurado.')
 
+    _validator = InputValidator(_db_client)
+    get_graph_builder.cache_clear()
+    get_nogood_store.cache_clear()
+
+    if RESOLVER_PROCESSES > 1:
+        _executor = create_executor(RESOLVER_PROCESSES)
+        logging.info('Busca paralela ativada com %d processos.', RESOLVER_PROCESSES)
+
+    refresh_result_cache()
+
 
 
 
-@app.on_event("shutdown")
 def shutdown_event():
     """
     Fecha a conexão ao parar o servidor.
@@ -63,10 +173,154 @@ def shutdown_event():
     
     logging.info('Encerrando aplicação...')
 
+    get_graph_builder.cache_clear()
+    get_nogood_store.cache_clear()
+
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
 
+    if _db_client is not None:
+        _db_client.close()
 
 
-def get_db() -> DBClient:
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Ciclo de vida da aplicação: inicializa os recursos antes de aceitar requisições e os libera ao parar.
+    """
+
+    # Amplia o pool de threads usado por anyio.to_thread.run_sync
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREAD_LIMIT
+
+    start_log_listener()
+    startup_event()
+    yield
+    shutdown_event()
+    stop_log_listener()
+
+
+
+
+class OrjsonResponse(JSONResponse):
+    """
+    Resposta JSON serializada com orjson (implementação em Rust), mais rápida que o json da biblioteca padrão
+    para planos de instalação grandes.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+
+
+class ResolveRequest(BaseModel):
+    """
+    Campos do formulário de POST /resolve.
+    Imutável: os campos são lidos diretamente, sem cópia para outro dicionário.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    python: str = Field(..., description='Versão do Python. Ex.: "3.10". Obs.: Adicione o valor entre aspas.')
+    wants: List[str] = Field(..., description='Lista de pacotes desejados. Ex: "mcp".')
+    fixed: Optional[str] = Field(None, description='Dicionário contendo os pacotes e versões fixas. Ex: {"numpy": ">=1.0"}.')
+    max_versions: Optional[int] = Field(None, description="Limite de versões por pacote durante as buscas.")
+
+
+    @field_validator('wants')
+    @classmethod
+    def split_wants(cls, wants: List[str]) -> List[str]:
+        """
+        Quebra itens separados por vírgula ou espaço (ex: "numpy, pandas") uma única vez, no parse da requisição.
+        Nomes repetidos sem diferenciar maiúsculas (ex: "Django" e "django") são mantidos uma única vez,
+        na grafia da primeira ocorrência.
+        """
+        # Uma única varredura da regex separa, remove espaços e descarta itens vazios
+        final_wants = [x for x in _WANTS_SPLIT.split(",".join(wants)) if x]
+
+        # O banco é indexado por LOWER(name), por isso a comparação usa lower() e não canonicalize_name
+        unique_wants = {}
+        for name in final_wants:
+            unique_wants.setdefault(name.lower(), name)
+
+        return list(unique_wants.values())
+
+
+
+
+# Inicialização da Aplicação
+app = FastAPI(
+    title="Python Dependency Resolver",
+    description="API para resolução de dependências de pacotes Python usando Backtracking e Heurísticas.",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=OrjsonResponse
+)
+
+
+
+
+def refresh_result_cache():
+    """
+    Descarta os resultados em cache se o arquivo do banco foi modificado desde que foram calculados.
+    """
+    global _result_cache_db_mtime
+
+    db_mtime = os.stat(DB_PATH).st_mtime
+    if db_mtime != _result_cache_db_mtime:
+        _result_cache.clear()
+        get_graph_builder.cache_clear()
+        get_nogood_store.cache_clear()
+        _result_cache_db_mtime = db_mtime
+
+
+
+
+def result_cache_key(python: str, wants: List[str], fixed: dict, max_versions: Optional[int]) -> bytes:
+    """
+    Gera a chave do cache de resultados a partir de um JSON canônico da entrada.
+    """
+    canonical = json.dumps(
+        {"p": python, "w": sorted(w.lower() for w in wants), "f": fixed, "m": max_versions},
+        sort_keys=True,
+        separators=(',', ':'),
+        default=str
+    )
+    return hashlib.blake2b(canonical.encode(), digest_size=16).digest()
+
+
+
+
+@lru_cache(maxsize=GRAPH_BUILDER_CACHE_SIZE)
+def get_graph_builder(python_version: str, max_versions: Optional[int]) -> GraphBuilder:
+    """
+    Retorna o GraphBuilder da combinação (versão do Python, max_versions), criando-o na primeira chamada.
+    Os caches de candidatos e dependências do GraphBuilder passam a ser reaproveitados entre requisições.
+    """
+    return GraphBuilder(
+        db_client=_db_client,
+        python_version=python_version,
+        max_versions_per_package=max_versions
+    )
+
+
+
+
+@lru_cache(maxsize=GRAPH_BUILDER_CACHE_SIZE)
+def get_nogood_store(python_version: str) -> NogoodStore:
+    """
+    Retorna os nogoods aprendidos pelas resoluções sem max_versions da versão do Python informada.
+    Conflitos descobertos em uma requisição (ex: "mcp") podam a busca de requisições seguintes (ex: "mcp" + "numpy").
+    Com max_versions não há compartilhamento: sob a poda top-k um nogood não vale fora da resolução que o aprendeu.
+    """
+    return NogoodStore()
+
+
+
+
+async def get_db() -> DBClient:
     """
     Função de Dependência (Dependency Injection).
     Retorna a instância ativa do banco de dados para os endpoints que precisarem.
@@ -81,26 +335,16 @@ def get_db() -> DBClient:
 
 
 
-def prepare_requirements(input_data: dict) -> Dict[str, SpecifierSet]:
+def prepare_requirements(fixed: Dict[str, str], wants: List[str]) -> Dict[str, SpecifierSet]:
     """
-    Converte o input 'fixed' e 'wants' para o formato interno do Resolver.
+    Converte o input 'fixed' e 'wants' (já validados) para o formato interno do Resolver.
     """
-    requirements = {}
-    
-    if 'fixed' in input_data and input_data['fixed']:
-        
-        for pkg, spec_str in input_data['fixed'].items():
-            requirements[pkg] = SpecifierSet(spec_str)
-            
-
-    if 'wants' in input_data and input_data['wants']:
-
-        for pkg in input_data['wants']:
+    requirements = {pkg: cached_specifier_set(spec_str) for pkg, spec_str in fixed.items()}
 
-            if pkg not in requirements:
-                requirements[pkg] = SpecifierSet("")     
+    for pkg in wants:
+        requirements.setdefault(pkg.lower(), EMPTY_SPEC)
                 
-    logging.info(f'Requisitos definidos: {requirements}')
+    logging.info('Requisitos definidos: %s', requirements)
                 
     return requirements
 
@@ -115,7 +359,7 @@ def prepare_requirements(input_data: dict) -> Dict[str, SpecifierSet]:
         summary="Verifica se a API está em execução.",
         description="Endpoint raiz para verificar o status da API."
         )
-def read_root():
+async def read_root():
     return {"message": "Dependency Resolver API is running. Use POST /resolve to solve dependencies."}
 
 
@@ -132,20 +376,70 @@ def read_root():
         Obs.: Adicione o valor do campo 'python' entre aspas para que seja interpretado como string.
         """
         )
-def resolve_dependencies(
-        python: str = Form(..., description='Versão do Python. Ex.: "3.10". Obs.: Adicione o valor entre aspas.'),
-        wants: List[str] = Form(..., description='Lista de pacotes desejados. Ex: "mcp".'),
-        fixed: Optional[str] = Form(None, description='Dicionário contendo os pacotes e versões fixas. Ex: {"numpy": ">=1.0"}.'),
-        max_versions: Optional[int] = Form(None, description="Limite de versões por pacote durante as buscas."),
+async def resolve_dependencies(
+        request: Annotated[ResolveRequest, Form()],
         db_client: DBClient = Depends(get_db)):
     """
     Endpoint principal para resolver dependências.
 
+    """
+    return await run_resolution(request)
+
+
+
+
+@app.post(
+        "/resolve/stream",
+        tags=["Dependency Resolution"],
+        summary="Resolve dependências e retorna o resultado em NDJSON.",
+        description="""
+        Mesma entrada e resolução de /resolve, com a resposta enviada em NDJSON (application/x-ndjson):
+        a primeira linha traz status, versão do Python, estatísticas e tempo; cada linha seguinte é um
+        pacote do plano de instalação, na ordem de instalação.
+        """
+        )
+async def resolve_dependencies_stream(
+        request: Annotated[ResolveRequest, Form()],
+        db_client: DBClient = Depends(get_db)):
+    """
+    Variante de /resolve que envia o plano de instalação linha a linha, sem serializar um único JSON.
+    """
+    result = await run_resolution(request)
+    return StreamingResponse(iter_ndjson(result), media_type="application/x-ndjson")
+
+
+
+
+async def iter_ndjson(result: dict):
+    """
+    Gera o resultado em NDJSON: uma linha com os campos gerais (sem o plano) e uma linha por pacote do plano.
+    Gerador assíncrono, para que o StreamingResponse não consuma cada linha via threadpool.
+    """
+    header = {key: value for key, value in result.items() if key != 'install_plan'}
+    yield orjson.dumps(header) + b"\n"
+
+    for item in result.get('install_plan', ()):
+        yield orjson.dumps(item) + b"\n"
+
+
+
+
+async def run_resolution(request: ResolveRequest) -> dict:
+    """
+    Valida a requisição e executa (ou obtém do cache) a resolução, retornando o resultado com o tempo total.
+    Compartilhado por /resolve e /resolve/stream.
     """
 
     # Tempo de início de execução
     start_time = time.time()
 
+    python = request.python
+    fixed = request.fixed
+    max_versions = request.max_versions
+
+    # Itens de 'wants' já chegam separados por vírgula e sem espaços (ResolveRequest.split_wants)
+    final_wants = request.wants
+
     # Validação do campo 'python'
     if not python or not python.strip():
         logging.error("O campo 'python' é obrigatório e não pode ser vazio.")
@@ -160,61 +454,62 @@ def resolve_dependencies(
     if fixed:
         try:
             # Tenta converter a string de entrada em um dicionário
-            fixed_dict = json.loads(fixed)
+            fixed_dict = orjson.loads(fixed)
 
             if not isinstance(fixed_dict, dict):
                 raise ValueError
             
-        except (json.JSONDecodeError, ValueError):
+        except (orjson.JSONDecodeError, ValueError):
             logging.error('Erro ao processar o campo "fixed".')
             raise HTTPException(status_code=400, detail='O campo "fixed" deve ser um dicionário válido (ex: {"pkg": "==1.0"}).')
     
 
-    # Processamento do campo 'wants' 
-    final_wants = []
-    if wants:
-        for item in wants:
-            # Se o item contiver vírgula, quebra ele. Se não, mantém.
-            if "," in item:
-                parts = [x.strip() for x in item.split(",") if x.strip()]
-                final_wants.extend(parts)
-            elif item.strip():
-                final_wants.append(item.strip())
-
-    else:
+    # Validação do campo 'wants' 
+    if not final_wants:
         logging.error('O campo "wants" é obrigatório e deve conter ao menos um pacote.')
         raise HTTPException(status_code=400, detail='O campo "wants" é obrigatório e deve conter ao menos um pacote.')
 
 
-    # Montagem do JSON 
+    # Montagem do JSON no formato do InputValidator, que normaliza 'fixed' e 'wants' no próprio dicionário
     input_data = {
         "python": python,
         "fixed": fixed_dict,
-        "wants": final_wants if final_wants else [],
+        "wants": final_wants,
         "max_versions": max_versions
     }
 
-    logging.info(f'Requisição recebida: {input_data}')
+    logging.info('Requisição recebida: %r', input_data)
+
+    # Resultado já calculado para a mesma entrada: a resolução é determinística para um mesmo banco
+    refresh_result_cache()
+    cache_key = result_cache_key(python, input_data['wants'], fixed_dict, max_versions)
+    cached_result = _result_cache.get(cache_key)
+    if cached_result is not None:
+        duration = time.time() - start_time
+        logging.info("Resultado obtido do cache em %.4fs.", duration)
+        return {**cached_result, 'total_time_seconds': round(duration, 4)}
 
-    validator = InputValidator(db_client)
-    is_valid, error_msg = validator.validate(input_data)
+    # Validação e resolução acessam o SQLite e consomem CPU: executadas em thread, fora do event loop
+    is_valid, error_msg = await anyio.to_thread.run_sync(_validator.validate, input_data)
     
     if not is_valid:
         raise HTTPException(status_code=400, detail=error_msg)
     
-    gb = GraphBuilder(
-        db_client=db_client,
-        python_version=python,
-        max_versions_per_package=max_versions
+    # Resolver guarda o estado da busca, por isso é o único objeto criado por requisição
+    resolver = Resolver(
+        graph_builder=get_graph_builder(python, max_versions),
+        nogoods=None if max_versions else get_nogood_store(python)
     )
-    
-    resolver = Resolver(graph_builder=gb)
 
     # Execução
     try:
-        reqs_map = prepare_requirements(input_data)
-        logging.info(f'Resolvendo para Python: {python}, alvos: {list(reqs_map.keys())}.')
-        result = resolver.resolve(reqs_map)
+        reqs_map = prepare_requirements(input_data['fixed'], input_data['wants'])
+        logging.info('Resolvendo para Python: %s, alvos: %s.', python, list(reqs_map))
+        if _executor is not None:
+            result = await anyio.to_thread.run_sync(resolve_parallel, _executor, DB_PATH, resolver.gb, reqs_map)
+        else:
+            result = await anyio.to_thread.run_sync(resolver.resolve, reqs_map)
+        _result_cache[cache_key] = dict(result)
 
         # Tempo de término de execução
         end_time = time.time()
@@ -225,11 +520,11 @@ def resolve_dependencies(
         # Injeção do tempo no dicionário de resposta
         result['total_time_seconds'] = round(duration, 4)
 
-        logging.info(f"Resolução concluída em {duration:.4f}s.")
+        logging.info("Resolução concluída em %.4fs.", duration)
 
         return result
 
-    except Exception as e:
+    except Exception:
 
         # Tempo de término de execução
         end_time = time.time()
@@ -237,12 +532,20 @@ def resolve_dependencies(
         # Cálculo da duração
         duration = end_time - start_time
 
-        logging.error(f"Erro interno do servidor: {str(e)}. Tempo decorrido: {duration:.4f}s")
-        import traceback
-        logging.error(traceback.format_exc())
+        # logging.exception anexa o traceback ao registro; só é formatado se o registro passar pelo nível do logger
+        logging.exception("Erro interno do servidor. Tempo decorrido: %.4fs", duration)
         raise HTTPException(status_code=500, detail=f"Erro interno do servidor. Tempo decorrido: {duration:.4f}s")
 
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="localhost", port=8000, reload=True)
\ No newline at end of file
+    # uvloop + httptools: event loop e parser HTTP de alto desempenho (uvloop não existe no Windows)
+    uvicorn.run(
+        "main:app",
+        host="localhost",
+        port=8000,
+        loop="uvloop" if os.name != "nt" else "asyncio",
+        http="httptools",
+        reload=False,
+        workers=os.cpu_count()
+    )
\ No newline at end of file
@@ -0,0 +1,107 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from db_client import DBClient
+from graph_builder import GraphBuilder
+from resolver import Resolver
+from version_cache import cached_specifier_set
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+# GraphBuilders mantidos em cada processo de trabalho, um por combinação (banco, versão do Python, max_versions)
+WORKER_GRAPH_BUILDER_CACHE_SIZE = 32
+
+
+
+
+def create_executor(workers):
+    """
+    Cria o pool de processos da busca paralela.
+    Usa 'spawn': o processo servidor tem threads (anyio) e conexões SQLite abertas, que não sobrevivem a um fork.
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+
+
+@lru_cache(maxsize=WORKER_GRAPH_BUILDER_CACHE_SIZE)
+def _worker_graph_builder(db_path, python_version, max_versions):
+    """
+    GraphBuilder do processo de trabalho, com conexão própria ao banco (conexões SQLite não são serializáveis).
+    Reaproveitado entre as subárvores recebidas pelo processo.
+    """
+    return GraphBuilder(
+        db_client=DBClient(db_path),
+        python_version=python_version,
+        max_versions_per_package=max_versions
+    )
+
+
+
+
+def _resolve_subtree(db_path, python_version, max_versions, specs, index):
+    """
+    Executado no processo de trabalho: resolve apenas a subárvore do candidato 'index' do primeiro pacote.
+    Recebe só dados serializáveis (restrições em texto) e devolve o dicionário de resultado do Resolver.
+    """
+    graph_builder = _worker_graph_builder(db_path, python_version, max_versions)
+    requirements_map = {name: cached_specifier_set(spec) for name, spec in specs.items()}
+    return Resolver(graph_builder).resolve(requirements_map, root_slice=slice(index, index + 1))
+
+
+
+
+def resolve_parallel(executor, db_path, graph_builder, requirements_map):
+    """
+    Divide a busca pelos candidatos do primeiro pacote escolhido (MRV), uma subárvore por tarefa do pool.
+    As subárvores são independentes (cada processo tem seu próprio estado e trail); os processos livres
+    pegam a próxima tarefa da fila assim que terminam a anterior.
+
+    O resultado é o mesmo da busca sequencial: a primeira solução na ordem dos candidatos vence, e as
+    tarefas seguintes ainda não iniciadas são canceladas.
+    """
+
+    resolver = Resolver(graph_builder)
+    package, candidates = resolver.root_candidates(requirements_map)
+
+    # Sem escolha no primeiro nível não há o que dividir
+    if len(candidates) < 2:
+        return resolver.resolve(requirements_map)
+
+    logging.info('Busca paralela: %d subárvore(s) para "%s".', len(candidates), package)
+
+    specs = {name: str(spec) for name, spec in requirements_map.items()}
+    futures = [
+        executor.submit(_resolve_subtree, db_path, graph_builder.python_version, graph_builder.max_versions, specs, index)
+        for index in range(len(candidates))
+    ]
+
+    stats = {"steps": 0, "backtracks": 0, "backjumps": 0}
+    result = None
+
+    try:
+        # Percorre na ordem dos candidatos: uma solução só é aceita após as subárvores anteriores falharem
+        for future in futures:
+            result = future.result()
+            for key in stats:
+                stats[key] += result['stats'][key]
+
+            if result['status'] == 'ok':
+                result['stats'] = stats
+                return result
+
+    finally:
+        for future in futures:
+            future.cancel()
+
+    return {
+        "status": "conflict",
+        "python_version": graph_builder.python_version,
+        "message": f"Falha ao resolver '{package}'. Todas as {len(candidates)} versões falharam. Último erro: {result['message']}.",
+        "debug_info": {
+            "package_causing_conflict": None,
+            "constraint_violated": None
+        },
+        "stats": stats
+    }
@@ -1,49 +1,165 @@
 import logging
-from packaging.specifiers import SpecifierSet
+from collections import deque
+from version_cache import EMPTY_SPEC
     
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
+# Mensagens por passo da busca ficam em DEBUG; em INFO sai apenas o resumo de cada resolução
+logger = logging.getLogger(__name__)
+
+
+
+
+# Item de conjunto de conflito que representa um requisito da entrada (fixed/wants) sobre um pacote.
+# Os demais itens são nomes de pacotes, representando a versão escolhida para eles.
+_ROOT = "<root>"
+
+# Marca, no trail, uma chave que não existia antes da alteração (desfazer = remover a chave)
+_MISSING = object()
+
+# Quantidade máxima de nogoods mantidos por NogoodStore
+NOGOOD_STORE_SIZE = 100_000
+
 
 
 
 class ConflictError(Exception):
     """
     Exceção personalizada para sinalizar falhas na resolução (Backtracking).
+    'culprits' é o conjunto de conflito: as decisões (nomes de pacotes) e requisitos da entrada ((_ROOT, pacote))
+    que, juntos, já bastam para a falha. None = desconhecido (todas as decisões são suspeitas).
     """
 
-    def __init__(self, message, package=None, constraint=None, parent_error=None):
+    def __init__(self, message, package=None, constraint=None, parent_error=None, culprits=None):
 
         super().__init__(message)
         self.package = package
         self.constraint = constraint
         self.parent_error = parent_error
+        self.culprits = culprits
+
+
+
+
+class NogoodStore:
+    """
+    Nogoods aprendidos: combinações de versões escolhidas e requisitos da entrada que comprovadamente não levam a
+    uma solução. Pode ser compartilhado entre resoluções com a mesma versão do Python e o mesmo banco, sem
+    max_versions: os candidatos e as dependências de cada pacote são os mesmos. Com a poda por max_versions
+    um nogood depende das restrições em vigor, não só das decisões, e por isso não é reaproveitável.
+
+    Cada nogood é um frozenset de itens (pacote, versão) e (_ROOT, pacote, restrição), indexado por cada
+    item (pacote, versão) que contém.
+    """
+
+    def __init__(self, maxsize=NOGOOD_STORE_SIZE):
+
+        self.maxsize = maxsize
+        self._count = 0
+        self._by_decision = {}
+
+
+
+    def add(self, nogood):
+        """
+        Registra um nogood. Ao atingir o limite, o armazenamento é reiniciado.
+        """
+        decisions = [item for item in nogood if len(item) == 2]
+        if not decisions:
+            return
+
+        if self._count >= self.maxsize:
+            # Troca o dicionário em vez de limpá-lo: leitores concorrentes seguem com a referência antiga
+            self._by_decision = {}
+            self._count = 0
+
+        for item in decisions:
+            self._by_decision.setdefault(item, []).append(nogood)
+        self._count += 1
+
+
+
+    def candidates_for(self, package, version):
+        """
+        Retorna os nogoods que contêm a decisão (pacote, versão).
+        """
+        return self._by_decision.get((package, version), ())
 
 
 
 
 class Resolver:
 
-    def __init__(self, graph_builder):
+    def __init__(self, graph_builder, nogoods=None):
+        """
+        Args:
+            graph_builder: Instância do GraphBuilder.
+            nogoods (NogoodStore, optional): Nogoods compartilhados com outras resoluções de mesma
+                                             versão do Python, sem max_versions. Se None, vale apenas para esta resolução.
+                                             Ignorado quando o GraphBuilder poda candidatos (max_versions).
+        """
 
         self.gb = graph_builder
+        self.nogoods = nogoods if nogoods is not None else NogoodStore()
+
+        # Backjumping e nogoods supõem que os candidatos de um pacote só diminuem quando a restrição aperta.
+        # Com a poda por max_versions (top-k) isso não vale: uma restrição mais apertada pode trazer de volta
+        # versões antes cortadas. Nesse caso a busca é cronológica, sem aprender nem consultar nogoods.
+        self._conflict_directed = not graph_builder.max_versions
         # Estatísticas para debug e análise de performance
-        self.stats = {"steps": 0, "backtracks": 0}
+        self.stats = {"steps": 0, "backtracks": 0, "backjumps": 0}
+
+        # Restrições da entrada, em texto, usadas para verificar nogoods: { 'pacote': '>=1.0' }
+        self._root_specs = {}
 
+        # Memoização da resolução atual: (pacote, SpecifierSet) -> candidatos e (pacote, versão) -> dependências.
+        # A chave usa o próprio SpecifierSet (hashável), sem formatá-lo em texto a cada consulta.
+        self._cand_cache = {}
+        self._deps_cache = {}
 
+        # Memoização da resolução atual: (SpecifierSet, versão) -> a versão atende à restrição.
+        # Os mesmos pares são verificados de novo para cada candidato irmão do mesmo nível.
+        self._contains_cache = {}
 
-    def resolve(self, requirements_map):
+        # Fatia dos candidatos do primeiro nível da busca (None = todos)
+        self._root_slice = None
+
+
+
+    def root_candidates(self, requirements_map):
+        """
+        Retorna o primeiro pacote que a busca escolhe (MRV sobre os requisitos da entrada) e os seus candidatos.
+        Cada candidato é a raiz de uma subárvore independente, que pode ser explorada separadamente
+        com resolve(requirements_map, root_slice=...).
+        """
+
+        self._cand_cache = {}
+        constraints = {k.lower(): v for k, v in requirements_map.items()}
+        todo_list = list(constraints)
+        package = todo_list[self._select_mrv_package(todo_list, constraints)]
+        return package, self._get_candidates(package, constraints[package])
+
+
+
+    def resolve(self, requirements_map, root_slice=None):
         """
         Ponto de entrada do algoritmo.
         
         Args:
             requirements_map (dict): { 'pacote': SpecifierSet('>=1.0') }
                                      Pacotes iniciais solicitados (fixed + wants).
+            root_slice (slice, optional): Restringe os candidatos do primeiro pacote escolhido (ver root_candidates),
+                                          explorando apenas essas subárvores da busca.
         
         Returns:
             dict: Estrutura de sucesso ou erro.
         """
 
-        self.stats = {"steps": 0, "backtracks": 0}
+        self.stats = {"steps": 0, "backtracks": 0, "backjumps": 0}
+        self._root_slice = root_slice
+        self._cand_cache = {}
+        self._deps_cache = {}
+        self._contains_cache = {}
         
         # Normaliza nomes de pacotes para minúsculas
         normalized_reqs = {k.lower(): v for k, v in requirements_map.items()}
@@ -57,9 +173,13 @@ class Resolver:
         # Pacotes com restrição mas ainda sem versão definida
         todo_list = list(constraints.keys())
 
+        # Origem das restrições de cada pacote: requisitos da entrada e pacotes cujas versões escolhidas as impuseram
+        self._root_specs = {package: str(spec) for package, spec in normalized_reqs.items()}
+        reasons = {package: frozenset([(_ROOT, package)]) for package in normalized_reqs}
+
         try:
 
-            solution = self._backtracking(assignments, constraints, todo_list)
+            solution = self._backtracking(assignments, constraints, todo_list, reasons)
 
             out = {
                 "status": "ok",
@@ -68,12 +188,10 @@ class Resolver:
                 "stats": self.stats
             }
 
-            logging.info(f"{out}")
-
             return out
         
         except ConflictError as e:
-            logging.info(f"Conflito detectado: {str(e)}")
+            logger.info("Conflito detectado: %s", e)
             return {
                 "status": "conflict",
                 "python_version": self.gb.python_version,
@@ -87,212 +205,441 @@ class Resolver:
 
 
 
-    def _backtracking(self, assignments, constraints, todo_list):
+    def _backtracking(self, assignments, constraints, todo_list, reasons):
         """
-        Núcleo recursivo do resolvedor.
+        Núcleo do resolvedor: busca em profundidade com pilha explícita (sem recursão, sem limite de profundidade).
+        O estado (assignments, constraints, todo_list, reasons) é alterado no próprio objeto, sem cópias por ramo:
+        cada alteração de um candidato é registrada em um trail e desfeita quando ele falha.
+        Usa backjumping dirigido por conflitos: uma falha cujo conjunto de conflito não inclui o pacote
+        de um nível é propagada sem testar os demais candidatos dele, pois trocar a versão não a evitaria.
         """
 
-        self.stats["steps"] += 1
-        
-        # Se não há mais pacotes na lista 'todo', uma solução válida foi encontrada
-        if not todo_list:
-            logging.info(f"Solução encontrada com {len(assignments)} pacote(s) após {self.stats['steps']} passos e {self.stats['backtracks']} backtracks.")
-            return assignments
+        # Cada nível da pilha: pacote em resolução, seus candidatos e o estado da iteração sobre eles
+        stack = []
 
+        # Conflito pendente, a ser tratado pelo nível do topo da pilha
+        error = None
 
-        # Escolha de qual pacote resolver agora
-        package_to_solve = self._select_mrv_package(todo_list, constraints)
-        if constraints[package_to_solve] != SpecifierSet(""):
-            logging.info(f'Resolvendo "{package_to_solve}" com restrição "{constraints[package_to_solve]}".')
-        
-        else:
-            logging.info(f'Resolvendo "{package_to_solve}" sem restrição específica.')
+        # Nível de log consultado uma vez por resolução, não a cada passo
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
 
+        while True:
 
-        # Remove o pacote escolhido da lista de pendências para a próxima iteração
-        new_todo_list = [package for package in todo_list if package != package_to_solve]
+            if error is None:
+
+                self.stats["steps"] += 1
+                
+                # Se não há mais pacotes na lista 'todo', uma solução válida foi encontrada
+                if not todo_list:
+                    logger.info("Solução encontrada com %d pacote(s) após %d passos, %d backtracks e %d níveis saltados por backjumping.", len(assignments), self.stats['steps'], self.stats['backtracks'], self.stats['backjumps'])
+                    return assignments
+
+
+                # Escolha de qual pacote resolver agora
+                position = self._select_mrv_package(todo_list, constraints)
+                package_to_solve = todo_list[position]
+                if debug_enabled:
+                    if constraints[package_to_solve] != EMPTY_SPEC:
+                        logger.debug('Resolvendo "%s" com restrição "%s".', package_to_solve, constraints[package_to_solve])
+                    
+                    else:
+                        logger.debug('Resolvendo "%s" sem restrição específica.', package_to_solve)
 
-        # Busca Candidatos
-        required_spec = constraints[package_to_solve]
-        candidates = self.gb.get_candidate_versions(package_to_solve, required_spec)
-        
-        # As restrições atuais eliminaram todas as versões possíveis do pacote atual
-        if not candidates:
 
-            self.stats["backtracks"] += 1
+                # Busca Candidatos
+                required_spec = constraints[package_to_solve]
+                candidates = self._get_candidates(package_to_solve, required_spec)
+                
+                # As restrições atuais eliminaram todas as versões possíveis do pacote atual
+                if not candidates:
+
+                    self.stats["backtracks"] += 1
+
+                    logger.debug('Sem versões compatíveis para "%s" com a restrição "%s".', package_to_solve, required_spec)
+                    error = ConflictError(
+                        f'Sem versões compatíveis para "{package_to_solve}" com a restrição "{required_spec}".',
+                        package=package_to_solve,
+                        constraint=required_spec,
+                        culprits=reasons[package_to_solve]
+                    )
+
+                else:
+                    # Remove o pacote escolhido da lista de pendências (recolocado na mesma posição se este nível falhar).
+                    # A posição vem do MRV, sem nova busca linear na lista.
+                    del todo_list[position]
+
+                    # Primeiro nível de uma busca parcial: apenas a fatia de candidatos atribuída a ela
+                    if not stack and self._root_slice is not None:
+                        candidates = candidates[self._root_slice]
+
+                    stack.append({
+                        'package': package_to_solve,
+                        'position': position,
+                        'candidates': candidates,
+                        'next': 0,
+                        # Alterações do candidato atual: (dicionário, chave, valor anterior ou _MISSING)
+                        'trail': [],
+                        # Pendências adicionadas pelo candidato atual ficam após esta marca
+                        'todo_mark': len(todo_list),
+                        # União dos conjuntos de conflito das falhas dos candidatos (None = desconhecido)
+                        'conflict_set': set(),
+                        'last_error': None,
+                        # Motivo registrado nas dependências de qualquer candidato deste nível (criado uma única vez)
+                        'reason': frozenset([package_to_solve]),
+                    })
+
+
+            # Trata o conflito pendente e avança o nível do topo para o próximo candidato viável
+            while True:
+
+                if not stack:
+                    raise error
+
+                frame = stack[-1]
+                package_to_solve = frame['package']
+
+                if error is not None:
+
+                    # Desfaz as alterações do candidato que falhou
+                    self._undo(frame['trail'])
+                    del todo_list[frame['todo_mark']:]
+
+                    # Backjump: a falha não depende da versão deste pacote, nenhum outro candidato a evitaria
+                    if self._conflict_directed and error.culprits is not None and package_to_solve not in error.culprits:
+                        self.stats["backjumps"] += 1
+                        stack.pop()
+                        todo_list.insert(frame['position'], package_to_solve)
+                        continue
+
+                    self._record_failure(frame, error)
+                    error = None
+
+                # Próximo candidato que não gera conflito imediato
+                candidates = frame['candidates']
+                while frame['next'] < len(candidates):
+
+                    candidate = candidates[frame['next']]
+                    frame['next'] += 1
+                    frame['trail'] = []
+
+                    try:
+                        self._apply_candidate(package_to_solve, frame['reason'], candidate, assignments, constraints, todo_list, reasons, frame['trail'])
+                        break
+
+                    except ConflictError as e:
+                        # Essa versão do candidato não serviu, tenta a próxima
+                        self._undo(frame['trail'])
+                        del todo_list[frame['todo_mark']:]
+                        self._record_failure(frame, e)
+
+                else:
+                    # Nenhuma versão serviu e deve ser feito um Backtrack no nível superior.
+                    # A falha é causada pelas restrições que limitaram os candidatos e pelos conflitos de cada um deles.
+                    self.stats["backtracks"] += 1
+                    stack.pop()
+                    todo_list.insert(frame['position'], package_to_solve)
+
+                    conflict_set = frame['conflict_set'] if self._conflict_directed else None
+                    if conflict_set is not None:
+                        conflict_set.discard(package_to_solve)
+                        conflict_set = frozenset(conflict_set | reasons[package_to_solve])
+                        self._learn_nogood(conflict_set, assignments)
+
+                    last_error = frame['last_error']
+                    error = ConflictError(
+                        f"Falha ao resolver '{package_to_solve}'. Todas as {len(candidates)} versões falharam. Último erro: {last_error}.",
+                        parent_error=last_error,
+                        culprits=conflict_set
+                    )
+                    continue
+
+                # Candidato aplicado: desce para o próximo pacote
+                break
+
+
+
+    def _apply_candidate(self, package_to_solve, reason, candidate, assignments, constraints, todo_list, reasons, trail):
+        """
+        Aplica a escolha de 'candidate' para 'package_to_solve': verifica conflitos com as decisões já tomadas
+        e acrescenta as restrições e pendências das suas dependências, registrando cada alteração em 'trail'.
+        Lança ConflictError se o candidato é incompatível (as alterações parciais ficam no trail).
+        'reason' é frozenset([package_to_solve]), invariante entre os candidatos do mesmo nível.
+        """
 
-            logging.info(f'Sem versões compatíveis para "{package_to_solve}" com a restrição "{required_spec}".')
-            raise ConflictError(
-                f'Sem versões compatíveis para "{package_to_solve}" com a restrição "{required_spec}".',
-                package=package_to_solve,
-                constraint=required_spec
-            )
+        version = candidate['version']
 
-        last_error = None
-        
-        for candidate in candidates:
+        # Combinação já conhecida como sem solução: descarta o candidato sem explorar a subárvore
+        if self._conflict_directed:
+            self._check_nogoods(package_to_solve, version, assignments)
 
-            version = candidate['version']
+        # Busca de dependências do candidato
+        dependencies = self._get_dependencies(package_to_solve, version)
+        logger.debug('Dependências de %s %s: %s', package_to_solve, version, dependencies)
+
+        # Referências locais para o laço de dependências
+        get_candidates = self._get_candidates
+        contains_cache = self._contains_cache
+
+        # Verificação de Compatibilidade com decisões anteriores já tomadas
+        # O GraphBuilder já entrega nomes em minúsculas e SpecifierSet prontos (sem novo parse)
+        for dependency_name, new_spec in dependencies:
             
-            try:
-                # Busca de dependências do candidato
-                dependencies = self.gb.get_dependencies(package_to_solve, version)
-                logging.info(f'Dependências de {package_to_solve} {version}: {dependencies}')
-
-                # Verificação de Compatibilidade com decisões anteriores já tomadas
-                new_constraints = constraints.copy()
-                new_todo_additions = []
-                
-                for dependency_name, dependency_specifier in dependencies:
-                    dependency_name = dependency_name.lower()
-                    new_spec = SpecifierSet(dependency_specifier)
-                    
-                    # Checagem se o pacote dependente já foi instalado com versão incompatível
-                    if dependency_name in assignments:
+            # Checagem se o pacote dependente já foi instalado com versão incompatível
+            assigned = assignments.get(dependency_name)
+            if assigned is not None:
 
-                        assigned_ver = assignments[dependency_name]['version_obj']
+                assigned_ver = assigned['version_obj']
 
-                        if not new_spec.contains(assigned_ver, prereleases=True):
+                contains_key = (new_spec, assigned['version'])
+                satisfied = contains_cache.get(contains_key)
+                if satisfied is None:
+                    satisfied = contains_cache[contains_key] = new_spec.contains(assigned_ver, prereleases=True)
 
-                            logging.info(f"Conflito: {package_to_solve} {version} requer {dependency_name}{new_spec}, mas {dependency_name} já foi fixado em {assigned_ver}.")
-                            raise ConflictError(
-                                f"Conflito: {package_to_solve} {version} requer {dependency_name}{new_spec}, mas {dependency_name} já foi fixado em {assigned_ver}."
-                            )
-                    
-                    # Merge de restrições
-                    # Se 'A' pedia numpy>=1.0 e agora 'B' pede numpy<1.15, a nova restrição global para numpy será ">=1.0,<1.15".
-                    if dependency_name in new_constraints:
+                if not satisfied:
 
-                        current_spec = new_constraints[dependency_name]
+                    logger.debug("Conflito: %s %s requer %s%s, mas %s já foi fixado em %s.", package_to_solve, version, dependency_name, new_spec, dependency_name, assigned_ver)
+                    raise ConflictError(
+                        f"Conflito: {package_to_solve} {version} requer {dependency_name}{new_spec}, mas {dependency_name} já foi fixado em {assigned_ver}.",
+                        culprits=frozenset([package_to_solve, dependency_name])
+                    )
+            
+            # Merge de restrições
+            # Se 'A' pedia numpy>=1.0 e agora 'B' pede numpy<1.15, a nova restrição global para numpy será ">=1.0,<1.15".
+            current_spec = constraints.get(dependency_name, _MISSING)
+            trail.append((constraints, dependency_name, current_spec))
 
-                        combined_spec_str = f"{current_spec},{new_spec}"
+            if current_spec is not _MISSING:
 
-                        new_constraints[dependency_name] = SpecifierSet(combined_spec_str)
+                # Interseção direta dos specifiers (SpecifierSet.__and__), sem reformatar e reprocessar o texto acumulado
+                constraints[dependency_name] = current_spec & new_spec
 
-                    else:
-                        new_constraints[dependency_name] = new_spec
+            else:
+                constraints[dependency_name] = new_spec
 
-                        # Se é uma nova dependência ainda não resolvida, adiciona à lista de 'todo'
-                        if dependency_name not in assignments:
-                            new_todo_additions.append(dependency_name)
+                # Se é uma nova dependência ainda não resolvida, adiciona à lista de 'todo'.
+                # Todo pacote pendente tem entrada em 'constraints', que serve de conjunto para o teste em O(1).
+                if dependency_name not in assignments:
+                    todo_list.append(dependency_name)
 
+            # A restrição (ou a própria presença) de dependency_name passa a depender desta escolha
+            current_reasons = reasons.get(dependency_name, _MISSING)
+            trail.append((reasons, dependency_name, current_reasons))
+            reasons[dependency_name] = reason if current_reasons is _MISSING else current_reasons | reason
 
-                # Recursão
-                new_assignments = assignments.copy()
-                new_assignments[package_to_solve] = candidate
-                
-                # Atualiza a lista de tarefas com as novas dependências descobertas
-                next_todo = new_todo_list + [package for package in new_todo_additions if package not in new_todo_list]
-                logging.info(f"Próxima lista de pacotes a resolver: {next_todo}.")
+            # Verificação antecipada: se a restrição resultante não deixa candidatos para a dependência pendente,
+            # o candidato é descartado aqui, sem descer um nível só para o MRV encontrar 0 candidatos.
+            # A lista é a mesma que o MRV consultaria no passo seguinte (memorizada), então não há consulta extra.
+            if assigned is None and dependency_name != package_to_solve:
+
+                merged_spec = constraints[dependency_name]
+                if not get_candidates(dependency_name, merged_spec):
+
+                    logger.debug('Conflito: %s %s deixa "%s" sem versões compatíveis com a restrição "%s".', package_to_solve, version, dependency_name, merged_spec)
+                    raise ConflictError(
+                        f'Conflito: {package_to_solve} {version} deixa "{dependency_name}" sem versões compatíveis com a restrição "{merged_spec}".',
+                        package=dependency_name,
+                        constraint=merged_spec,
+                        culprits=reasons[dependency_name]
+                    )
 
-                return self._backtracking(new_assignments, new_constraints, next_todo)
 
-            except ConflictError as e:
-                # Essa versão do candidato não serviu, tenta a próxima
-                last_error = e
-                continue
+        trail.append((assignments, package_to_solve, _MISSING))
+        assignments[package_to_solve] = candidate
         
-        # Se saiu do loop, nenhuma versão serviu e deve ser feito um Backtrack no nível superior
-        self.stats["backtracks"] += 1
+        logger.debug("Próxima lista de pacotes a resolver: %s.", todo_list)
+
+
+
+    @staticmethod
+    def _undo(trail):
+        """
+        Desfaz as alterações registradas no trail, na ordem inversa.
+        """
+        for mapping, key, previous in reversed(trail):
+            if previous is _MISSING:
+                del mapping[key]
+            else:
+                mapping[key] = previous
+        trail.clear()
+
+
+
+    @staticmethod
+    def _record_failure(frame, error):
+        """
+        Registra no nível a falha de um dos seus candidatos, acumulando o conjunto de conflito.
+        """
+        frame['last_error'] = error
+        if frame['conflict_set'] is not None:
+            frame['conflict_set'] = None if error.culprits is None else frame['conflict_set'] | error.culprits
+
+
+
+    def _get_candidates(self, package, spec):
+        """
+        Candidatos de 'package' sob 'spec', memorizados durante a resolução (MRV e backtracking repetem as consultas).
+        """
+        key = (package, spec)
+        candidates = self._cand_cache.get(key)
+        if candidates is None:
+            candidates = self._cand_cache[key] = self.gb.get_candidate_versions(package, spec)
+        return candidates
+
+
+
+    def _get_dependencies(self, package, version):
+        """
+        Dependências de 'package' na versão 'version', memorizadas durante a resolução
+        (reaproveitadas pela ordenação topológica).
+        """
+        key = (package, version)
+        dependencies = self._deps_cache.get(key)
+        if dependencies is None:
+            dependencies = self._deps_cache[key] = self.gb.get_dependencies(package, version)
+        return dependencies
 
-        raise ConflictError(
-            f"Falha ao resolver '{package_to_solve}'. Todas as {len(candidates)} versões falharam. Último erro: {last_error}.",
-            parent_error=last_error
-        )
+
+
+    def _learn_nogood(self, conflict_set, assignments):
+        """
+        Converte um conjunto de conflito em nogood, trocando cada decisão pela versão escolhida,
+        e o registra no NogoodStore.
+        """
+        nogood = []
+        for item in conflict_set:
+
+            if isinstance(item, tuple):
+                package = item[1]
+                nogood.append((_ROOT, package, self._root_specs[package]))
+
+            else:
+                assigned = assignments.get(item)
+                if assigned is None:
+                    return
+                nogood.append((item, assigned['version']))
+
+        self.nogoods.add(frozenset(nogood))
+
+
+
+    def _check_nogoods(self, package, version, assignments):
+        """
+        Lança ConflictError se a escolha (pacote, versão), junto com as decisões atuais e os requisitos da entrada,
+        contém algum nogood conhecido.
+        """
+        for nogood in self.nogoods.candidates_for(package, version):
+
+            culprits = []
+            for item in nogood:
+
+                if len(item) == 3:
+                    # Requisito da entrada: precisa existir nesta resolução com a mesma restrição
+                    if self._root_specs.get(item[1]) != item[2]:
+                        break
+                    culprits.append((_ROOT, item[1]))
+
+                else:
+                    name, nogood_version = item
+                    if name != package:
+                        assigned = assignments.get(name)
+                        if assigned is None or assigned['version'] != nogood_version:
+                            break
+                    culprits.append(name)
+
+            else:
+                raise ConflictError(
+                    f'Combinação sem solução já conhecida ao escolher "{package}" {version}.',
+                    package=package,
+                    culprits=frozenset(culprits)
+                )
 
 
 
     def _select_mrv_package(self, todo_list, constraints):
         """
         Aplica a heurística MRV.
-        Para cada pacote na lista, pergunta ao GraphBuilder quantos candidatos existem.
-        Retorna o pacote com menor número de candidatos.
+        Para cada pacote na lista, obtém a quantidade de candidatos (listas memorizadas na resolução: len em O(1)).
+        Retorna a posição, em todo_list, do pacote com menor número de candidatos.
         """
 
-        best_pkg = None
+        best_position = None
         min_candidates = float('inf')
+        python_version = self.gb.python_version
+        get_candidates = self._get_candidates
+        debug_enabled = logger.isEnabledFor(logging.DEBUG)
         
-        for package in todo_list:
+        for position, package in enumerate(todo_list):
 
-            spec = constraints.get(package, SpecifierSet(""))
+            spec = constraints.get(package, EMPTY_SPEC)
+            count = len(get_candidates(package, spec))
 
-            candidates = self.gb.get_candidate_versions(package, spec)
-            count = len(candidates)
-            if spec != SpecifierSet(""):
-                logging.info(f'Pacote "{package}" tem {count} candidato(s) com a restrição "{spec}" e compatíveis com a versão Python {self.gb.python_version}.')
-            
-            else:
-                logging.info(f'Pacote "{package}" tem {count} candidato(s) sem restrição específica e compatíveis com a versão Python {self.gb.python_version}.')
+            # Mensagens com argumentos: o specifier só é formatado se o log for emitido.
+            # A escolha da mensagem (comparação de specifiers) também só é feita com DEBUG ativo.
+            if debug_enabled:
+                if spec != EMPTY_SPEC:
+                    logger.debug('Pacote "%s" tem %d candidato(s) com a restrição "%s" e compatíveis com a versão Python %s.', package, count, spec, python_version)
+                
+                else:
+                    logger.debug('Pacote "%s" tem %d candidato(s) sem restrição específica e compatíveis com a versão Python %s.', package, count, python_version)
 
-            # Se count é 0, já escolhe para falhar imediatamente (Fail-Fast)
-            if count == 0:
-                return package
-            
-            # Se count é 1, é uma escolha forçada, prioridade máxima
-            if count == 1:
-                return package
+            # Se count é 0, já escolhe para falhar imediatamente (Fail-Fast).
+            # Se count é 1, é uma escolha forçada, prioridade máxima. Em ambos os casos a varredura termina aqui.
+            if count <= 1:
+                return position
 
             # Varredura para encontrar a biblioteca com menor quantidade de candidatos
             if count < min_candidates:
                 min_candidates = count
-                best_pkg = package
+                best_position = position
                 
-        return best_pkg
+        return best_position
 
 
 
     def _topological_sort(self, assignments):
         """
-        Ordena os pacotes tal que dependências venham antes dos dependentes.
+        Ordena os pacotes tal que dependências venham antes dos dependentes (algoritmo de Kahn, iterativo).
         Usado para gerar a ordem de instalação correta.
         """
 
-        # Constroi grafo de dependência local baseado na solução encontrada
-        graph = {package: set() for package in assignments}
+        # Constroi grafo de dependência local baseado na solução encontrada:
+        # dependents[d] = pacotes que dependem de d; in_degree[p] = dependências de p que fazem parte da solução
+        dependents = {package: [] for package in assignments}
+        in_degree = dict.fromkeys(assignments, 0)
         
         for package, data in assignments.items():
 
-            version = data['version']
-
-            # Re-consulta as dependências da versão ESCOLHIDA
-            deps = self.gb.get_dependencies(package, version)
+            # Dependências da versão ESCOLHIDA, já memorizadas durante a busca
+            deps = self._get_dependencies(package, data['version'])
             
-            for dependency_name, _ in deps:
-
-                dependency_name = dependency_name.lower()
+            # Nomes repetidos na lista de dependências contam uma única aresta
+            for dependency_name in dict.fromkeys(name for name, _ in deps):
 
                 # A dependência só entra no grafo se ela faz parte da solução 
-                if dependency_name in graph:
+                if dependency_name in dependents and dependency_name != package:
 
                     # Para instalação: dependency_name deve vir antes de package
-                    graph[package].add(dependency_name)
+                    dependents[dependency_name].append(package)
+                    in_degree[package] += 1
 
-        visited = set()
-        temp_visited = set()
+        # Começa pelos pacotes sem dependências na solução, na ordem em que foram resolvidos
+        queue = deque(package for package, degree in in_degree.items() if degree == 0)
         order = []
 
-        def visit(node):
+        while queue:
 
-            if node in visited:
-                return
-            
-            if node in temp_visited:
-                # Ciclo detectado
-                return
-            
-            temp_visited.add(node)
-            
-            # Visita dependências primeiro
-            for dependency in graph[node]:
-                visit(dependency)
-            
-            temp_visited.remove(node)
-            visited.add(node)
-            order.append(node)
+            package = queue.popleft()
+            order.append(package)
+
+            for dependent in dependents[package]:
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    queue.append(dependent)
 
-        # Itera sobre todos os nós
-        for package in assignments:
-            visit(package)
+        # Ciclo detectado: os pacotes restantes entram no final, na ordem em que foram resolvidos
+        if len(order) < len(in_degree):
+            placed = set(order)
+            order.extend(package for package in assignments if package not in placed)
             
         return order
 
@@ -3,9 +3,15 @@ import os
 import sys
 import time
 import requests
+import urllib3
 import logging
 import gzip
+import io
 import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from db_client import DBClient
 
 # --- CONFIGURAÇÃO DE LOGS ---
@@ -22,41 +28,222 @@ DB_URL = "https://github.com/pypi-data/pypi-json-data/releases/download/latest/p
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, "..", "dados", "pypi-data.sqlite")
 
-# Colunas para remover
-DROP_COLUMNS = [
+# Colunas para remover (conjunto: consultado para cada coluna da tabela)
+DROP_COLUMNS = {
     'id', 'description', 'summary', 'author', 'author_email', 
     'maintainer', 'maintainer_email', 'package_url', 'license', 
     'home_page', 'project_url', 'plataform'
-]
+}
+
+# Tamanho dos blocos lidos do stream de download e escritos no disco (4 MiB)
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Conexões simultâneas no download por faixas (HTTP Range)
+DOWNLOAD_WORKERS = 4
+
+# Tamanho de cada faixa pedida ao servidor (16 MiB: amortiza o custo de cada requisição e redirecionamento).
+# Ficam em memória no máximo 2 faixas por conexão
+RANGE_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Tentativas por faixa antes de desistir do download (espera exponencial entre elas: 1s, 2s, 4s, ...)
+RANGE_RETRIES = 5
+
+# Tempo máximo (s) para conectar e entre pacotes recebidos: conexões travadas falham e a faixa é pedida de novo
+RANGE_TIMEOUT = 60
+
+# Tamanho de página do arquivo reescrito por clean_database (64 KiB: árvores mais rasas e menos páginas por varredura)
+COMPACT_PAGE_SIZE = 65536
+
+# Colunas mantidas em que '' e 'null' representam ausência de valor (convertidos para NULL)
+NULLABLE_COLUMNS = {'requires_dist', 'requires_python'}
+
+def remove_if_exists(path):
+    """
+    Remove o arquivo, se existir (uma única chamada de sistema, sem consultar a existência antes).
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class RangeNotSupportedError(Exception):
+    """
+    O servidor (ou o destino de um redirecionamento) ignorou o cabeçalho Range.
+    Não é repetida: o download segue pela conexão única.
+    """
+
+class RangedDownload(io.RawIOBase):
+    """
+    Arquivo somente leitura com o conteúdo de 'url', baixado em faixas (HTTP Range) por várias conexões
+    ao mesmo tempo. As faixas são entregues na ordem do arquivo; as seguintes já vão sendo baixadas
+    enquanto a atual é lida, com memória limitada a algumas faixas.
+    """
+
+    def __init__(self, url, size, workers=DOWNLOAD_WORKERS, chunk_size=RANGE_CHUNK_SIZE):
+        self.url = url
+        self.size = size
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._local = threading.local()
+        self._sessions = []
+        self._pending = deque()
+        self._next_offset = 0
+        self._buffer = memoryview(b"")
+
+        for _ in range(workers * 2):
+            self._schedule()
+
+    def _schedule(self):
+        # Pede a próxima faixa ainda não solicitada
+        if self._next_offset >= self.size:
+            return
+        start = self._next_offset
+        end = min(start + self.chunk_size, self.size) - 1
+        self._next_offset = end + 1
+        self._pending.append(self._executor.submit(self._fetch, start, end))
+
+    def _fetch(self, start, end):
+        # Uma falha de rede custa só a faixa: ela é pedida de novo, sem recomeçar o download inteiro
+        for attempt in range(RANGE_RETRIES):
+            try:
+                return self._fetch_once(start, end)
+            except (requests.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+                if attempt == RANGE_RETRIES - 1:
+                    raise
+                delay = 2 ** attempt
+                logger.warning(f"Falha na faixa {start}-{end}: {e}. Nova tentativa em {delay}s...")
+                time.sleep(delay)
+
+    def _fetch_once(self, start, end):
+        # Uma sessão (conexão reaproveitada) por thread: requests.Session não é segura entre threads
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            self._sessions.append(session)
+
+        headers = {'Range': f'bytes={start}-{end}', 'Accept-Encoding': 'identity'}
+        expected = end - start + 1
+        with session.get(self.url, headers=headers, stream=True, timeout=RANGE_TIMEOUT) as r:
+            r.raise_for_status()
+
+            # Verificado antes de ler o corpo: uma resposta 200 traria o arquivo inteiro para a memória
+            content_range = r.headers.get('Content-Range', '')
+            if r.status_code != 206 or not content_range.startswith(f'bytes {start}-{end}/'):
+                raise RangeNotSupportedError(
+                    f"Faixa {start}-{end} não atendida (status {r.status_code}, Content-Range '{content_range}')."
+                )
+
+            # Leitura única da faixa inteira; r.content a montaria em um laço Python de blocos de 10 KiB
+            data = r.raw.read(expected, decode_content=False)
+
+        if len(data) != expected:
+            raise IOError(f"Faixa {start}-{end} incompleta: {len(data)} de {expected} bytes")
+        return data
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            if not self._pending:
+                return 0
+            self._buffer = memoryview(self._pending.popleft().result())
+            self._schedule()
+
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            for session in self._sessions:
+                session.close()
+        super().close()
+
+def get_ranged_size(url):
+    """
+    Retorna o tamanho do arquivo remoto se o servidor aceita requisições por faixa (Accept-Ranges: bytes).
+    Retorna None se não aceita, se o tamanho é desconhecido ou se o arquivo é pequeno demais para dividir.
+    """
+    try:
+        r = requests.head(url, allow_redirects=True, headers={'Accept-Encoding': 'identity'})
+        r.raise_for_status()
+    except requests.RequestException as e:
+        logger.warning(f"Não foi possível consultar o tamanho do arquivo: {e}")
+        return None
+
+    if r.headers.get('Accept-Ranges', '').lower() != 'bytes':
+        return None
+
+    size = int(r.headers.get('Content-Length') or 0)
+    return size if size > RANGE_CHUNK_SIZE else None
+
+def extract_stream(fileobj, f_out):
+    """
+    Descompacta (gzip) o conteúdo lido de 'fileobj' diretamente no arquivo aberto 'f_out'.
+    """
+    with gzip.GzipFile(fileobj=fileobj) as f_in:
+        # Blocos grandes: menos chamadas de sistema e o zlib descomprime mais dados por chamada
+        shutil.copyfileobj(f_in, f_out, length=COPY_BUFFER_SIZE)
 
 def download_and_stream_extract(url, dest_path):
     """
     Técnica de Streaming:
     Conecta o stream de download (requests) diretamente no descompactador (gzip)
     e escreve no disco apenas o arquivo final.
+    Se o servidor aceita requisições por faixa, o download usa várias conexões simultâneas.
     """
     logger.info("Arquivo não encontrado. Iniciando Download + Descompactação em Stream...")
     logger.info(f"Origem: {url}")
     
     os.makedirs(os.path.dirname(dest_path), exist_ok=True)
     
-    # Arquivo temporário para garantir que se falhar no meio, não fique um sqlite corrompido
-    temp_path = dest_path + ".tmp"
+    # Arquivo temporário para garantir que se falhar no meio, não fique um sqlite corrompido.
+    # Nome único no mesmo diretório do destino, para que a troca final seja um rename atômico.
+    temp_file = tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(dest_path), prefix=os.path.basename(dest_path) + ".", suffix=".tmp", delete=False
+    )
+    temp_path = temp_file.name
     
     start_time = time.time()
     
     try:
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            
-            # Aqui está a mágica: Passamos o socket bruto (raw) para o GzipFile.
-            # O Python vai baixando, descompactando na RAM e escrevendo no disco em chunks.
-            with gzip.GzipFile(fileobj=r.raw) as f_in:
-                with open(temp_path, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
+        with temp_file:
+            size = get_ranged_size(url)
+
+            if size:
+                # Uma única conexão fica limitada pela janela TCP e pelo servidor; várias faixas em paralelo somam a banda
+                logger.info(f"Download por faixas com {DOWNLOAD_WORKERS} conexões ({size / (1024*1024):.2f} MB comprimidos).")
+                try:
+                    with RangedDownload(url, size) as source:
+                        extract_stream(source, temp_file)
+
+                except RangeNotSupportedError as e:
+                    # Descarta o que foi escrito e recomeça pela conexão única
+                    logger.warning(f"{e} Seguindo com download em conexão única.")
+                    temp_file.seek(0)
+                    temp_file.truncate()
+                    size = None
+
+            if not size:
+                with requests.get(url, stream=True) as r:
+                    r.raise_for_status()
+                    
+                    # Aqui está a mágica: Passamos o socket bruto (raw) para o GzipFile.
+                    # O Python vai baixando, descompactando na RAM e escrevendo no disco em chunks.
+                    # decode_content=False: o GzipFile recebe os bytes comprimidos, sem decodificação prévia pelo urllib3.
+                    r.raw.decode_content = False
+                    extract_stream(r.raw, temp_file)
         
-        # Se chegou aqui, deu tudo certo. Renomeia para o oficial.
-        os.rename(temp_path, dest_path)
+        # O arquivo temporário é criado com permissão 0600; o banco segue legível como antes
+        os.chmod(temp_path, 0o644)
+
+        # Se chegou aqui, deu tudo certo. Substitui o oficial de forma atômica.
+        os.replace(temp_path, dest_path)
         
         duration = time.time() - start_time
         final_size = os.path.getsize(dest_path) / (1024*1024)
@@ -65,81 +252,114 @@ def download_and_stream_extract(url, dest_path):
 
     except Exception as e:
         logger.error(f"Erro no streaming: {e}")
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        remove_if_exists(temp_path)
         sys.exit(1)
 
 def get_connection():
-    client = DBClient(DB_PATH)
-    conn = client.get_connection()
+    conn = sqlite3.connect(DB_PATH)
     # Otimizações de performance do SQLite para operações em lote
+    # Setup é o único usuário do arquivo: trava uma vez, sem lock a cada escrita.
+    # Definido antes do journal_mode para que um arquivo em WAL saia dele sem o índice compartilhado (-shm).
+    conn.execute("PRAGMA locking_mode = EXCLUSIVE")
     conn.execute("PRAGMA journal_mode = OFF") # Arriscado em prod, mas ótimo para setup inicial
     conn.execute("PRAGMA synchronous = 0")    # Escreve sem esperar confirmação do disco (muito mais rápido)
     conn.execute("PRAGMA cache_size = 100000") # Usa mais RAM para cache
+    conn.execute("PRAGMA mmap_size = 30000000000") # Lê o arquivo mapeado em memória (limitado ao tamanho do arquivo)
+    conn.execute("PRAGMA temp_store = MEMORY") # Tabelas e ordenações temporárias em RAM, não em disco
     return conn
 
+def quote_identifier(name):
+    """
+    Cita um identificador para uso em SQL (DDL não aceita parâmetros), escapando aspas internas.
+    """
+    return '"' + name.replace('"', '""') + '"'
+
 def get_table_columns(cursor, table_name):
+    """
+    Retorna as colunas da tabela como pares (nome, tipo declarado).
+    O nome da tabela é passado como parâmetro (função de tabela pragma_table_info), sem formatar o SQL.
+    """
     try:
-        cursor.execute(f"PRAGMA table_info({table_name})")
-        return [row[1] for row in cursor.fetchall()]
+        cursor.execute("SELECT name, type FROM pragma_table_info(?)", (table_name,))
+        return cursor.fetchall()
     except sqlite3.OperationalError:
         return []
 
 def clean_database():
+    """
+    Reescreve a tabela 'projects' uma única vez em um arquivo novo, já sem as colunas descartadas,
+    com os valores vazios sanitizados e com a coluna 'name_lower' preenchida. O arquivo novo
+    substitui o original ao final, dispensando DROP COLUMN por coluna e o VACUUM.
+    """
     logger.info(f"Iniciando limpeza e otimização do banco...")
     
+    table = 'projects'
+    compact_path = DB_PATH + ".compact"
+    remove_if_exists(compact_path)
+
     conn = get_connection()
-    conn.isolation_level = None # Autocommit para comandos como VACUUM
+    conn.isolation_level = None # Autocommit: cada comando abaixo é uma operação completa
     cursor = conn.cursor()
 
     try:
-        # Remoção rápida de tabela
-        cursor.execute(f"DROP TABLE IF EXISTS urls")
-
-        # Remoção de Colunas
-        table = 'projects'
         current_columns = get_table_columns(cursor, table)
         
         if not current_columns:
             logger.error("Tabela projects não encontrada.")
             return
 
-        # Dica: Em SQLite, DROP COLUMN pode ser lento pois ele recria a tabela internamente.
-        # Mas vamos manter o padrão por enquanto.
-        cols_to_drop = [c for c in DROP_COLUMNS if c in current_columns]
-        
-        if cols_to_drop:
-            logger.info(f"Removendo {len(cols_to_drop)} colunas...")
-            for col in cols_to_drop:
-                cursor.execute(f"ALTER TABLE {table} DROP COLUMN {col}")
-
-        # Sanitização e Coluna Lower
-        # Vamos fazer tudo em uma transação única para ser atômico e rápido
-        cursor.execute("BEGIN TRANSACTION")
-        
-        # Adiciona coluna se não existir
-        current_columns = get_table_columns(cursor, table)
-        if 'name_lower' not in current_columns:
-            logger.info("Criando coluna auxiliar 'name_lower'...")
-            cursor.execute(f"ALTER TABLE {table} ADD COLUMN name_lower TEXT")
-            # Update massivo otimizado
-            logger.info("Populando 'name_lower'...")
-            cursor.execute(f"UPDATE {table} SET name_lower = LOWER(name)")
-        
-        cursor.execute("COMMIT")
-        
-        # VACUUM é pesado, mas necessário para reduzir o tamanho do arquivo
-        logger.info("Executando VACUUM final...")
-        cursor.execute("VACUUM")
+        # Colunas mantidas, com o tipo declarado original ('name_lower' é sempre recalculada)
+        kept_columns = [(c, t) for c, t in current_columns if c not in DROP_COLUMNS and c != 'name_lower']
+        logger.info(f"Removendo {len(current_columns) - len(kept_columns)} colunas...")
+
+        # Projeção única: '' e 'null' viram NULL nas colunas anuláveis e 'name_lower' é calculada na mesma leitura
+        projection = []
+        for c, _ in kept_columns:
+            if c in NULLABLE_COLUMNS:
+                projection.append(f'NULLIF(NULLIF({quote_identifier(c)}, \'\'), \'null\')')
+            else:
+                projection.append(quote_identifier(c))
+        projection.append('LOWER("name")')
+
+        column_defs = [f'{quote_identifier(c)} {t}'.strip() for c, t in kept_columns] + ['"name_lower" TEXT']
+
+        # Apenas 'projects' é copiada: a tabela 'urls' (e qualquer outra) fica de fora do arquivo novo
+        cursor.execute("ATTACH DATABASE ? AS compact", (compact_path,))
+        cursor.execute("PRAGMA compact.journal_mode = OFF")
+        cursor.execute("PRAGMA compact.synchronous = 0")
+        # cache_size vale por banco: sem isso o anexado usaria o padrão (2 MB). Negativo = KiB, independente da página
+        cursor.execute("PRAGMA compact.cache_size = -262144")
+        # Só tem efeito antes da primeira escrita no arquivo novo
+        cursor.execute(f"PRAGMA compact.page_size = {COMPACT_PAGE_SIZE}")
+
+        # Criação e cópia em um único script e transação (os PRAGMAs acima não podem ficar dentro de uma)
+        logger.info("Copiando dados para o arquivo compactado...")
+        cursor.executescript(f"""
+            BEGIN;
+            CREATE TABLE compact."{table}" ({", ".join(column_defs)});
+            INSERT INTO compact."{table}" SELECT {", ".join(projection)} FROM main."{table}";
+            COMMIT;
+        """)
+        cursor.execute("DETACH DATABASE compact")
+        conn.close()
+
+        # Troca atômica: o arquivo novo já é denso, sem páginas livres
+        os.replace(compact_path, DB_PATH)
+
+        # Cria os índices usados em tempo de execução (DBClient de escrita faz isso ao conectar).
+        # As consultas filtram por LOWER(name), atendidas pelo índice de expressão (LOWER(name), version);
+        # por isso 'name_lower' não recebe índice próprio, que não seria usado e só ocuparia espaço.
+        logger.info("Criando índices...")
+        client = DBClient(DB_PATH, read_only=False)
+        client.get_connection()
+        client.close()
         
         logger.info("Limpeza finalizada.")
 
     except Exception as e:
         logger.critical(f"Erro na limpeza: {e}")
-        try:
-            cursor.execute("ROLLBACK")
-        except:
-            pass
+        conn.close()
+        remove_if_exists(compact_path)
         # Não damos exit aqui para não travar o boot se for erro SQL menor
 
 def main():
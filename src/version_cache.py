@@ -0,0 +1,27 @@
+from functools import lru_cache
+from packaging.specifiers import SpecifierSet
+from packaging.version import Version
+
+# Restrição vazia (qualquer versão), compartilhada: SpecifierSet não é alterado após criado
+EMPTY_SPEC = SpecifierSet("")
+
+
+
+
+@lru_cache(maxsize=65536)
+def cached_version(version_str):
+    """
+    Retorna o objeto Version da string, reutilizando parses anteriores.
+    Lança InvalidVersion para strings inválidas (exceções não são armazenadas no cache).
+    """
+    return Version(version_str)
+
+
+
+@lru_cache(maxsize=65536)
+def cached_specifier_set(specifier_str):
+    """
+    Retorna o SpecifierSet da string, reutilizando parses anteriores.
+    Lança InvalidSpecifier para especificadores inválidos.
+    """
+    return SpecifierSet(specifier_str)
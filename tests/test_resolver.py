@@ -0,0 +1,87 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from packaging.specifiers import SpecifierSet
+from db_client import DBClient
+from graph_builder import GraphBuilder
+from resolver import Resolver, NogoodStore
+
+
+
+
+def make_db(path, packages):
+    """
+    Cria um banco mínimo com a tabela 'projects'.
+    packages: { 'pacote': { 'versão': ['dependência PEP 508', ...] } }
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE projects (name TEXT, version TEXT, requires_dist TEXT, requires_python TEXT, yanked INTEGER)")
+    for name, versions in packages.items():
+        for version, deps in versions.items():
+            conn.execute("INSERT INTO projects VALUES (?, ?, ?, NULL, 0)", (name, version, json.dumps(deps)))
+    conn.commit()
+    conn.close()
+    return DBClient(path)
+
+
+
+def plan(result):
+    return result["status"], sorted((p["package"], p["version"]) for p in result.get("install_plan", []))
+
+
+
+
+class MaxVersionsSearchTest(unittest.TestCase):
+    """
+    Com max_versions (poda top-k), uma restrição mais apertada pode trazer de volta versões antes cortadas:
+    a busca não pode saltar níveis nem reaproveitar nogoods.
+    """
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self._dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._dir.cleanup)
+        self.addCleanup(logging.disable, logging.NOTSET)
+
+    def db(self, packages):
+        client = make_db(os.path.join(self._dir.name, "pypi.sqlite"), packages)
+        self.addCleanup(client.close)
+        return client
+
+    def test_tighter_spec_restores_truncated_versions(self):
+        db = self.db({
+            "y": {"2.0": [], "1.0": ["p<3"]},
+            "p": {"3.0": ["z>=5"], "2.0": ["z>=5"], "1.0": []},
+            "z": {"1.0": []},
+        })
+        result = Resolver(GraphBuilder(db, "3.10", 2)).resolve({"y": SpecifierSet(), "p": SpecifierSet()})
+        self.assertEqual(plan(result), ("ok", [("p", "1.0"), ("y", "1.0")]))
+
+    def test_shared_store_does_not_leak_between_requests(self):
+        db = self.db({
+            "x": {"2.0": ["w>=1"], "1.0": ["q"]},
+            "y": {"1.0": ["q<3"]},
+            "q": {"3.0": ["z>=5"], "2.0": ["z>=5"], "1.0": []},
+            "z": {"1.0": []},
+        })
+        graph_builder = GraphBuilder(db, "3.10", 2)
+        store = NogoodStore()
+
+        first = Resolver(graph_builder, store).resolve({"x": SpecifierSet()})
+        self.assertEqual(first["status"], "conflict")
+
+        result = Resolver(graph_builder, store).resolve({"x": SpecifierSet(), "y": SpecifierSet()})
+        self.assertEqual(plan(result), ("ok", [("q", "1.0"), ("x", "1.0"), ("y", "1.0")]))
+
+
+
+
+if __name__ == "__main__":
+    unittest.main()